@@ -0,0 +1,76 @@
+"""Throughput of validating many patients record by record versus one cached TypeAdapter call.
+
+Run from the repo root:
+
+    python -m benchmarks.bulk_validation --records 100000
+
+Two payloads are measured: a JSON array as sent to POST /bulk/create and a
+{patient_id: record} document like patients.json.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from schema.adapters import PATIENT_LIST, PATIENT_RECORDS, StoredPatient
+from schema.pydantic_model import Patient
+
+
+def make_patients(count: int, seed: int = 15) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"P{i:07d}",
+            "name": "bench",
+            "city": rng.choice(("Pune", "Mumbai", "Delhi", "Nagpur")),
+            "age": rng.randint(1, 99),
+            "gender": rng.choice(("male", "female", "others")),
+            "height": round(rng.uniform(1.4, 1.99), 2),
+            "weight": round(rng.uniform(40, 120), 1),
+        }
+        for i in range(count)
+    ]
+
+
+def throughput(validate, raw: bytes, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        validate(raw)
+        best = min(best, time.perf_counter() - started)
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    patients = make_patients(args.records)
+    array = json.dumps(patients).encode("utf-8")
+    document = json.dumps({patient.pop("id"): patient for patient in patients}).encode("utf-8")
+
+    cases = {
+        "array: json.loads + Patient(**item)": (lambda raw: [Patient(**item) for item in json.loads(raw)], array),
+        "array: json.loads + validate_python": (lambda raw: PATIENT_LIST.validate_python(json.loads(raw)), array),
+        "array: validate_json": (PATIENT_LIST.validate_json, array),
+        "file: json.loads + StoredPatient(**record)": (
+            lambda raw: {key: StoredPatient(**record) for key, record in json.loads(raw).items()},
+            document,
+        ),
+        "file: validate_json": (PATIENT_RECORDS.validate_json, document),
+    }
+
+    print(f"{args.records} patients, best of {args.repeat}")
+    baselines = {}
+    for name, (validate, raw) in cases.items():
+        rate = throughput(validate, raw, args.records, args.repeat)
+        payload = name.split(":")[0]
+        baseline = baselines.setdefault(payload, rate)
+        print(f"{name:>44}: {rate:>10,.0f} patients/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Mixed read/write load test of the patient API, reports latency percentiles and RPS as JSON.
+
+Run from the repo root. In-process through ASGI, every dataset size runs in a
+fresh child process with its own seeded store:
+
+    python -m benchmarks.load_test --sizes 1000 100000 1000000 --duration 20 --concurrency 32 > report.json
+
+Against a local uvicorn, seed the data first and start the server on it:
+
+    python -m benchmarks.load_test --seed-only 100000 --data-dir /tmp/patients
+    PATIENTS_FILE=/tmp/patients/patients.json uvicorn main:app --workers 4
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --sizes 100000
+
+PATIENT_BACKEND, PATIENT_STORAGE_MODE, PATIENT_JSON_CODEC, RESPONSE_CACHE_*
+and the other store settings are read from the environment as usual, so
+the same command on two commits compares their store, cache and serializer.
+Seeded ids are P0000000 .. P{size - 1}, the workload relies on that.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+CITIES = ("Pune", "Mumbai", "Delhi", "Nagpur", "Guwahati", "Chennai")
+GENDERS = ("male", "female", "others")
+# operation -> relative weight, --mix overrides single entries (0 leaves one out)
+# every endpoint of the app is in the mix, the whole-store reads and the info endpoints rarely
+DEFAULT_MIX = {
+    "get": 40,
+    "view_page": 15,
+    "sort": 10,
+    "search": 10,
+    "analytics": 1,
+    "create": 8,
+    "edit": 8,
+    "delete": 3,
+    "bulk_create": 2,
+    "bulk_edit": 2,
+    "bulk_delete": 1,
+    "view_all": 1,
+    "export": 1,
+    "home": 1,
+    "health": 1,
+    "about": 1,
+    "cache_stats": 1,
+    "request_info": 1,
+}
+# GET endpoints without parameters
+STATIC_PATHS = {"home": "/", "health": "/health", "about": "/about", "cache_stats": "/cache/stats", "request_info": "/req"}
+BULK_SIZE = 50
+
+
+def patient_id(number: int) -> str:
+    return f"P{number:07d}"
+
+
+def synthetic_patient(rng: random.Random) -> dict:
+    return {
+        "name": "load",
+        "city": rng.choice(CITIES),
+        "age": rng.randint(1, 99),
+        "gender": rng.choice(GENDERS),
+        "height": round(rng.uniform(1.4, 1.99), 2),
+        "weight": round(rng.uniform(40, 140), 1),
+    }
+
+
+def data_paths(data_dir: str) -> dict:
+    """Store env settings pointing every backend at `data_dir`"""
+    return {
+        "PATIENTS_FILE": os.path.join(data_dir, "patients.json"),
+        "PATIENTS_DB": os.path.join(data_dir, "patients.db"),
+        "PATIENTS_SNAPSHOT": os.path.join(data_dir, "patients.snap"),
+    }
+
+
+def seed(size: int, data_dir: str, seed_value: int = 20) -> dict:
+    """Write `size` synthetic patients for the configured backend, returns their paths.
+
+    The store modules read their paths from the environment on import, so
+    the paths are exported before anything of store / schema is imported.
+    """
+    paths = data_paths(data_dir)
+    os.environ.update(paths)
+
+    from schema.batch_vitals import classify_records, np
+    from schema.pydantic_model import Patient
+    from store.snapshot import write_snapshot
+
+    rng = random.Random(seed_value)
+    data = {patient_id(number): synthetic_patient(rng) for number in range(size)}
+    if np is not None:
+        classify_records(list(data.values()))
+    else:
+        data = {key: Patient(id=key, **record).model_dump(exclude={"id"}) for key, record in data.items()}
+
+    write_snapshot(data, paths["PATIENTS_FILE"])
+    if os.getenv("PATIENT_BACKEND") == "sqlite":
+        from store.migrate import import_json
+
+        import_json(paths["PATIENTS_FILE"], paths["PATIENTS_DB"])
+    return paths
+
+
+class Workload:
+    """Picks the next request for a client, every worker owns one so ids never collide"""
+
+    def __init__(self, size: int, worker: int, mix: dict, seed_value: int):
+        self.size = size
+        self.worker = worker
+        self.rng = random.Random(seed_value * 1000 + worker)
+        self.operations = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.operations]
+        self.created: list = []
+        self.cursor = None
+        self.sequence = 0
+
+    def existing_id(self) -> str:
+        if self.created and self.rng.random() < 0.2:
+            return self.rng.choice(self.created)
+        return patient_id(self.rng.randrange(self.size)) if self.size else "missing"
+
+    def new_id(self) -> str:
+        self.sequence += 1
+        return f"L{self.worker}-{self.sequence}"
+
+    async def run(self, client: httpx.AsyncClient, name: str) -> httpx.Response:
+        rng = self.rng
+        if name == "get":
+            return await client.get(f"/patient/{self.existing_id()}")
+        if name == "view_page":
+            params = {"limit": 50}
+            if self.cursor:
+                params["cursor"] = self.cursor
+            response = await client.get("/view", params=params)
+            self.cursor = response.headers.get("x-next-cursor")
+            return response
+        if name == "sort":
+            params = {"order_by": rng.choice(("height", "weight", "bmi")), "descending": rng.choice(("true", "false")), "limit": 10}
+            return await client.get("/sort", params=params)
+        if name == "search":
+            params = {"city": rng.choice(CITIES), "age_min": rng.randint(1, 60), "limit": 20}
+            if rng.random() < 0.5:
+                params["verdict"] = rng.choice(("Underweight", "Normal weight", "Overweight", "Obese"))
+            return await client.get("/patients/search", params=params)
+        if name == "analytics":
+            return await client.get("/analytics", params={"group_by": rng.choice(("city", "gender"))})
+        if name == "view_all":
+            return await client.get("/view")
+        if name == "export":
+            return await client.get("/export", params={"format": rng.choice(("ndjson", "json"))})
+        if name in STATIC_PATHS:
+            return await client.get(STATIC_PATHS[name])
+        if name == "create":
+            new_id = self.new_id()
+            response = await client.post("/create", json={"id": new_id, **synthetic_patient(rng)})
+            if response.status_code == 201:
+                self.created.append(new_id)
+            return response
+        if name == "bulk_create":
+            items = [{"id": self.new_id(), **synthetic_patient(rng)} for _ in range(BULK_SIZE)]
+            response = await client.post("/bulk/create", json=items)
+            if response.status_code == 200:
+                self.created.extend(response.json()["created"])
+            return response
+        if name == "bulk_edit":
+            # distinct ids, a repeated id would only be reported back as an item error
+            ids = dict.fromkeys(self.existing_id() for _ in range(BULK_SIZE))
+            items = [{"id": patient_id, "weight": round(rng.uniform(40, 140), 1)} for patient_id in ids]
+            return await client.put("/bulk/edit", json=items)
+        if name == "edit":
+            return await client.put(
+                f"/edit/{self.existing_id()}",
+                json={"weight": round(rng.uniform(40, 140), 1), "gender": rng.choice(GENDERS)},
+            )
+        if name == "delete":
+            # only delete what this worker created, the seeded ids stay valid for reads
+            if not self.created:
+                return await self.run(client, "create")
+            return await client.delete(f"/delete/{self.created.pop(rng.randrange(len(self.created)))}")
+        if name == "bulk_delete":
+            if not self.created:
+                return await self.run(client, "bulk_create")
+            ids, self.created = self.created[-BULK_SIZE:], self.created[:-BULK_SIZE]
+            return await client.post("/bulk/delete", json=ids)
+        raise ValueError(f"Unknown operation {name!r}")
+
+    def next_operation(self) -> str:
+        return self.rng.choices(self.operations, self.weights)[0]
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)},
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def drive(client: httpx.AsyncClient, size: int, args) -> dict:
+    latencies = {name: [] for name in args.mix}
+    errors = {name: 0 for name in args.mix}
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(number: int):
+        workload = Workload(size, number, args.mix, args.seed)
+        while time.perf_counter() < deadline:
+            name = workload.next_operation()
+            started = time.perf_counter()
+            try:
+                response = await workload.run(client, name)
+                failed = response.status_code >= 500
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            errors[name] += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    every = [latency for values in latencies.values() for latency in values]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize(every, sum(errors.values()), elapsed),
+        "operations": {name: summarize(values, errors[name], elapsed) for name, values in latencies.items() if values},
+    }
+
+
+async def run_in_process(size: int, args) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="patients-load-")
+    started = time.perf_counter()
+    seed(size, data_dir, args.seed)
+    seed_s = time.perf_counter() - started
+
+    # imported after the env points at the seeded files
+    import main
+
+    try:
+        started = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            startup_s = time.perf_counter() - started
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+                result = await drive(client, size, args)
+            result["response_cache"] = main.response_cache.stats()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {"size": size, "seed_s": round(seed_s, 3), "startup_s": round(startup_s, 3), **result}
+
+
+async def run_against_url(size: int, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=None, limits=limits) as client:
+        return {"size": size, **await drive(client, size, args)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_mix(text: str) -> dict:
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, text.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, choose from {list(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per size")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="e.g. get=60,create=0,view_all=1")
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--url", help="load a running server instead of the app in-process")
+    parser.add_argument("--seed-only", type=int, metavar="SIZE", help="write a dataset to --data-dir and exit")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only is not None:
+        print(json.dumps(seed(args.seed_only, args.data_dir, args.seed)))
+        return
+    if args.child is not None:
+        # one size in this fresh process, the parent collects the line
+        print(json.dumps(asyncio.run(run_in_process(args.child, args))))
+        return
+
+    results = []
+    for size in args.sizes:
+        if args.url:
+            results.append(asyncio.run(run_against_url(size, args)))
+            continue
+        command = [sys.executable, "-m", "benchmarks.load_test", "--child", str(size)]
+        command += ["--duration", str(args.duration), "--concurrency", str(args.concurrency), "--seed", str(args.seed)]
+        command += ["--mix", ",".join(f"{name}={weight}" for name, weight in args.mix.items())]
+        child = subprocess.run(command, capture_output=True, text=True)
+        if child.returncode != 0:
+            sys.stderr.write(child.stderr)
+            sys.exit(child.returncode)
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+        print(f"size {size}: {results[-1]['total']}", file=sys.stderr)
+
+    settings = ("PATIENT_BACKEND", "PATIENT_STORAGE_MODE", "PATIENT_JSON_CODEC", "RESPONSE_CACHE_ENTRIES", "RESPONSE_CACHE_TTL")
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "target": args.url or "in-process asgi",
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "env": {name: os.environ[name] for name in settings if name in os.environ},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
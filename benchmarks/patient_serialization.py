@@ -0,0 +1,89 @@
+"""Micro-benchmark of Patient serialization with and without cached computed fields.
+
+Run from the repo root:
+
+    python -m benchmarks.patient_serialization --records 100000
+
+`UncachedPatient` is the model as it was before the cache: plain properties,
+and `decide_verdict` reading `compute_bmi` up to three times. Both models are
+built from the same records and then used the way add_patient does it, the
+verdict is read once and the patient is dumped with its computed fields.
+"""
+
+import argparse
+import random
+import time
+
+from pydantic import computed_field
+
+from schema.pydantic_model import FrozenPatient, Patient
+
+
+class UncachedPatient(Patient):
+    @computed_field
+    @property
+    def compute_bmi(self) -> float:
+        return round(self.weight / (self.height * self.height), 2)
+
+    @computed_field
+    @property
+    def decide_verdict(self) -> str:
+        if self.compute_bmi < 18.5:
+            return "Underweight"
+        elif self.compute_bmi < 25:
+            return "Normal weight"
+        elif self.compute_bmi < 30:
+            return "Overweight"
+        else:
+            return "Obese"
+
+
+def make_records(count: int, seed: int = 13) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"P{i:07d}",
+            "name": "bench",
+            "city": rng.choice(("Pune", "Mumbai", "Delhi", "Nagpur")),
+            "age": rng.randint(1, 99),
+            "gender": rng.choice(("male", "female", "others")),
+            "height": round(rng.uniform(1.4, 1.99), 2),
+            "weight": round(rng.uniform(40, 120), 1),
+        }
+        for i in range(count)
+    ]
+
+
+def run(model, records: list) -> tuple:
+    patients = [model(**record) for record in records]
+    started = time.perf_counter()
+    for patient in patients:
+        patient.decide_verdict
+        patient.model_dump(exclude_computed_fields=False)
+    return time.perf_counter() - started, patients
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    results = {}
+    dumps = {}
+    for model in (UncachedPatient, Patient, FrozenPatient):
+        elapsed, patients = run(model, records)
+        results[model.__name__] = elapsed
+        dumps[model.__name__] = [patient.model_dump() for patient in patients[:1000]]
+
+    assert dumps["Patient"] == dumps["UncachedPatient"] == dumps["FrozenPatient"], "cached values differ"
+    baseline = results["UncachedPatient"]
+    print(f"{args.records} records, verdict read + model_dump per patient")
+    for name, elapsed in results.items():
+        per_dump = elapsed / args.records * 1e6
+        saving = (baseline - elapsed) / args.records * 1e6
+        print(f"{name:>16}: {elapsed:7.3f}s  {per_dump:6.2f} us/dump  saving {saving:5.2f} us/dump")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Multi-threaded stress benchmark proving that concurrent patient writes are never lost.
+
+Run from the repo root:
+
+    python -m benchmarks.stress_concurrent_writes --threads 1 2 4 8 --creates 200 --increments 10
+
+Set PATIENT_BACKEND=sqlite to stress the SQLite repository instead of the json store.
+
+Every thread creates its own patients and then bumps the age of one shared
+patient with an If-Match read-modify-write loop (retrying on 412). At the
+end the patient count and the shared age must match exactly what was sent.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix="patients-stress-")
+os.environ["PATIENTS_FILE"] = os.path.join(TMP_DIR, "patients.json")
+os.environ["PATIENTS_DB"] = os.path.join(TMP_DIR, "patients.db")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+SHARED_ID = "SHARED"
+
+
+def new_patient(patient_id: str, age: int = 1) -> dict:
+    return {
+        "id": patient_id,
+        "name": "stress",
+        "city": "Pune",
+        "age": age,
+        "gender": "female",
+        "height": 1.6,
+        "weight": 60.0,
+    }
+
+
+def worker(client: TestClient, thread_no: int, creates: int, increments: int, stats: dict):
+    for i in range(creates):
+        response = client.post("/create", json=new_patient(f"T{thread_no}-{i}"))
+        assert response.status_code == 201, response.text
+
+    for _ in range(increments):
+        while True:
+            current = client.get(f"/patient/{SHARED_ID}")
+            age = current.json()["data"]["age"]
+            response = client.put(
+                f"/edit/{SHARED_ID}",
+                json={"age": age + 1, "gender": "female"},
+                headers={"If-Match": current.headers["ETag"]},
+            )
+            if response.status_code == 200:
+                break
+            assert response.status_code == 412, response.text
+            stats["retries"] += 1
+
+
+def run(threads: int, creates: int, increments: int) -> dict:
+    # fresh store for every run, the previous TestClient already closed it
+    for name in os.listdir(TMP_DIR):
+        os.remove(os.path.join(TMP_DIR, name))
+    stats = {"retries": 0}
+
+    with TestClient(main.app) as client:
+        client.post("/create", json=new_patient(SHARED_ID))
+        pool = [
+            threading.Thread(target=worker, args=(client, n, creates, increments, stats))
+            for n in range(threads)
+        ]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        patients = client.get("/view").json()
+        shared_age = patients[SHARED_ID]["age"]
+
+    expected_patients = threads * creates + 1
+    expected_age = 1 + threads * increments
+    lost = (expected_patients - len(patients)) + (expected_age - shared_age)
+    requests = threads * creates + threads * increments * 2 + stats["retries"] * 2
+    return {
+        "threads": threads,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(requests / elapsed, 1),
+        "if_match_retries": stats["retries"],
+        "lost_writes": lost,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--creates", type=int, default=200)
+    parser.add_argument("--increments", type=int, default=10)
+    args = parser.parse_args()
+
+    # age is capped at 119 by the Patient schema
+    if 1 + max(args.threads) * args.increments >= 120:
+        parser.error("threads * increments must stay below 119")
+
+    failed = False
+    try:
+        for threads in args.threads:
+            result = run(threads, args.creates, args.increments)
+            print(result)
+            failed = failed or result["lost_writes"] != 0
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
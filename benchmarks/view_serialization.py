@@ -0,0 +1,80 @@
+"""Serialization latency of the /view response body for every available json codec.
+
+Run from the repo root:
+
+    python -m benchmarks.view_serialization --sizes 10000 100000 1000000
+
+"fastapi default" is what /view did before store.codec: jsonable_encoder over
+the whole dict followed by starlette's JSONResponse.render. The other rows
+are CodecJSONResponse.render with each installed codec, which /view now
+calls directly on the store records.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from store import codec
+
+
+def make_patients(count: int, seed: int = 14) -> dict:
+    rng = random.Random(seed)
+    patients = {}
+    for i in range(count):
+        height = round(rng.uniform(1.4, 1.99), 2)
+        weight = round(rng.uniform(40, 120), 1)
+        bmi = round(weight / (height * height), 2)
+        patients[f"P{i:07d}"] = {
+            "name": "bench",
+            "city": rng.choice(("Pune", "Mumbai", "Delhi", "Nagpur")),
+            "age": rng.randint(1, 99),
+            "gender": rng.choice(("male", "female", "others")),
+            "height": height,
+            "weight": weight,
+            "compute_bmi": bmi,
+            "decide_verdict": "Normal weight",
+        }
+    return patients
+
+
+def serializers() -> dict:
+    found = {"fastapi default": lambda data: JSONResponse(jsonable_encoder(data)).body}
+    for name, factory in codec.CODECS.items():
+        try:
+            _, dumps, _, _ = factory()
+        except ImportError:
+            print(f"{name} is not installed, skipped")
+            continue
+        found[name] = dumps
+    return found
+
+
+def time_it(serialize, data, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize(data)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    found = serializers()
+    print(f"{'patients':>10}  " + "  ".join(f"{name:>16}" for name in found))
+    for size in args.sizes:
+        data = make_patients(size)
+        timings = [time_it(serialize, data, args.repeat) for serialize in found.values()]
+        print(f"{size:>10}  " + "  ".join(f"{timing * 1000:>13.1f} ms" for timing in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import Optional
 
 class Certification(BaseModel):
@@ -8,12 +8,21 @@ class Certification(BaseModel):
     # level: Optional[CertificationEnum]
     validation_date: Optional[str]
 
-def dto_2_db_convert(certification_dto: Certification):
+# ek baar bana ke reuse, TypeAdapter banana mehenga hai (validator compile hota hai)
+CERTIFICATION_LIST = TypeAdapter(list[Certification])
+
+
+def certifications_from_json(raw) -> list[Certification]:
+    # poora JSON array ek hi call mein parse + validate, beech mein json.loads wale dicts nahi bante
+    return CERTIFICATION_LIST.validate_json(raw)
+
+
+def dto_2_db_convert(certification_dto: list[Certification]):
 
     print("====")
     db_resource_certifications_list = []
-    for certification in certification_dto:
-        json_certifications = certification.dict()
+    # har certification pe .dict() ki jagah poori list ek hi dump_python call mein
+    for json_certifications in CERTIFICATION_LIST.dump_python(certification_dto):
         print(json_certifications, type(json_certifications))
     #     db_resource_certifications = db.ResourceCertification(**json_certifications)
     #     db_resource_certifications.resource_id = resource_id
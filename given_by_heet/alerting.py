@@ -0,0 +1,285 @@
+"""Asynchronous error alert mails, grouped per endpoint and status code and rate limited"""
+
+import ast
+import asyncio
+import email
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("root")
+
+
+def parse_recipients(value) -> List[str]:
+    """Recipients from a setting like ERROR_EMAILS
+
+    Args:
+        value: a list, a python list literal ("['a@x.com', 'b@x.com']") or
+            comma separated addresses
+
+    Returns:
+        List[str]: the addresses
+    """
+    if isinstance(value, (list, tuple)):
+        return [str(address) for address in value]
+    value = (value or "").strip()
+    if value.startswith("["):
+        return [str(address) for address in ast.literal_eval(value)]
+    return [address.strip() for address in value.split(",") if address.strip()]
+
+
+def trace_link(trace_id: int, region: str) -> str:
+    """CloudWatch X-Ray link of an OpenTelemetry trace id"""
+    xray_id = f"1-{format(trace_id, '032x')}"
+    xray_id = f"{xray_id[:10]}-{xray_id[10:]}"
+    return f"https://console.aws.amazon.com/cloudwatch/home?region={region}#xray:traces/{xray_id}"
+
+
+@dataclass
+class ErrorGroup:
+    """Errors of one endpoint and status code not mailed yet"""
+
+    endpoint: str
+    status_code: int
+    count: int = 0
+    trace_ids: list = field(default_factory=list)
+    last_sent: float = float("-inf")
+
+
+class ErrorAlerter:
+    """Collects 5xx errors and mails them from a background task.
+
+    `report` only counts the error under its (endpoint, status code) group,
+    it never blocks and is safe to call from any thread. Every
+    `flush_interval` seconds the worker mails the groups that are due:
+
+    - the first error of a group is mailed on the next flush
+    - later errors of the group within `window` seconds of its last mail
+      are held back and sent as one digest once the window has passed
+    - at most `max_emails` mails go out per sliding `window`; when more
+      groups are due than that allows, the rest share one digest mail, and
+      with no mails left they wait for the window to free up
+
+    Mails are sent by `sender(recipients, subject, message)` in a thread.
+    """
+
+    def __init__(
+        self,
+        sender: Callable[[List[str], str, str], None],
+        recipients: List[str],
+        region: str = "",
+        window: float = 300,
+        max_emails: int = 10,
+        flush_interval: float = 1.0,
+        max_links: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.sender = sender
+        self.recipients = recipients
+        self.region = region
+        self.window = window
+        self.max_emails = max_emails
+        self.flush_interval = flush_interval
+        self.max_links = max_links
+        self.clock = clock
+        self.reported = 0
+        self.sent = 0
+        self.send_failures = 0
+        self._groups: Dict[Tuple[str, int], ErrorGroup] = {}
+        self._sent_at: deque = deque()
+        self._lock = threading.Lock()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the worker on the running event loop, safe to call more than once"""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._worker.get_loop() is loop:
+            return
+        self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker and mail what is still held back, as far as the rate limit allows"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self._send_all(self.collect(force=True))
+
+    def report(self, endpoint: str, status_code: int, trace_id: int):
+        """Count one error response
+
+        Args:
+            endpoint (str): path of the request
+            status_code (int): its response status
+            trace_id (int): trace id of the request, linked in the mail
+        """
+        with self._lock:
+            self.reported += 1
+            key = (endpoint, status_code)
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = ErrorGroup(endpoint, status_code)
+            group.count += 1
+            if len(group.trace_ids) < self.max_links:
+                group.trace_ids.append(trace_id)
+
+    def collect(self, force: bool = False) -> List[Tuple[str, str]]:
+        """Take the (subject, message) mails that are due now
+
+        Args:
+            force (bool): treat every group with errors as due, used on shutdown
+        """
+        now = self.clock()
+        with self._lock:
+            while self._sent_at and now - self._sent_at[0] >= self.window:
+                self._sent_at.popleft()
+            budget = self.max_emails - len(self._sent_at)
+            due = [
+                group
+                for group in self._groups.values()
+                if group.count and (force or now - group.last_sent >= self.window)
+            ]
+            if budget <= 0 or not due:
+                return []
+
+            if len(due) > budget:
+                mails = [self._mail([group]) for group in due[: budget - 1]]
+                mails.append(self._mail(due[budget - 1:]))
+            else:
+                mails = [self._mail([group]) for group in due]
+            for group in due:
+                group.count = 0
+                group.trace_ids = []
+                group.last_sent = now
+            self._sent_at.extend([now] * len(mails))
+
+            # groups quiet for a whole window are forgotten, their next error mails at once again
+            for key, group in list(self._groups.items()):
+                if not group.count and now - group.last_sent >= self.window:
+                    del self._groups[key]
+            return mails
+
+    def _mail(self, groups: List[ErrorGroup]) -> Tuple[str, str]:
+        if len(groups) == 1 and groups[0].count == 1:
+            group = groups[0]
+            subject = f"JMBAXI Error code {group.status_code} in {group.endpoint}"
+            return subject, f"Trace link: {trace_link(group.trace_ids[0], self.region)}"
+
+        if len(groups) == 1:
+            group = groups[0]
+            subject = f"JMBAXI {group.count} x Error code {group.status_code} in {group.endpoint}"
+        else:
+            total = sum(group.count for group in groups)
+            subject = f"JMBAXI {total} errors in {len(groups)} endpoints"
+        lines = []
+        for group in groups:
+            lines.append(f"{group.count} x Error code {group.status_code} in {group.endpoint}")
+            lines.extend(f"  Trace link: {trace_link(trace_id, self.region)}" for trace_id in group.trace_ids)
+            if group.count > len(group.trace_ids):
+                lines.append(f"  ... {group.count - len(group.trace_ids)} more")
+        return subject, "\n".join(lines)
+
+    async def _send_all(self, mails: List[Tuple[str, str]]):
+        for subject, message in mails:
+            try:
+                await asyncio.to_thread(self.sender, self.recipients, subject, message)
+                self.sent += 1
+                logger.info(f"Mailed error alert: {subject}")
+            except Exception as e:
+                self.send_failures += 1
+                logger.error(f"Error alert {subject!r} could not be mailed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._send_all(self.collect())
+
+    def stats(self) -> dict:
+        with self._lock:
+            held = sum(group.count for group in self._groups.values())
+        return {
+            "reported": self.reported,
+            "sent": self.sent,
+            "held_back": held,
+            "send_failures": self.send_failures,
+        }
+
+
+class SMTPSender:
+    """Sends alert mails straight to an SMTP server, e.g. a local SMTPStub"""
+
+    def __init__(self, host: str, port: int = 25, from_address: str = "alerts@localhost", timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.from_address = from_address
+        self.timeout = timeout
+
+    def __call__(self, recipients: List[str], subject: str, message: str):
+        mail = EmailMessage()
+        mail["From"] = self.from_address
+        mail["To"] = ", ".join(recipients)
+        mail["Subject"] = subject
+        mail.set_content(message)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(mail)
+
+
+class SMTPStub:
+    """Minimal local SMTP server that keeps every mail it receives in `messages`.
+
+    For tests and local runs: start it, point an SMTPSender at its `port`
+    and assert on the parsed `email.message.Message` objects it collected.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages: List[email.message.Message] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 localhost SMTP stub")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            verb = line.decode("utf-8", errors="replace").strip()[:4].upper()
+            if verb in ("HELO", "EHLO", "MAIL", "RCPT", "RSET", "NOOP"):
+                await reply("250 OK")
+            elif verb == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                data = bytearray()
+                while True:
+                    chunk = await reader.readline()
+                    if chunk in (b".\r\n", b".\n", b""):
+                        break
+                    # undo the dot stuffing of lines starting with "."
+                    data += chunk[1:] if chunk.startswith(b"..") else chunk
+                self.messages.append(email.message_from_bytes(bytes(data)))
+                await reply("250 OK")
+            elif verb == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                await reply("502 Command not implemented")
+        writer.close()
@@ -2,8 +2,13 @@ from sqlalchemy import event
 from src.dao.db import SessionLocal
 from src.core.config import get_app_settings
 from src.dao.models.passenger import Passenger, ShipCallManifest
+import asyncio
+import atexit
 import logging
+import random
 import threading
+from contextlib import asynccontextmanager
+from typing import Optional
 from src.service.converter import Converter
 from src.middlewares.tracing import authorization_var, trace_id_var
 from src.middlewares.middleware import header_var
@@ -14,48 +19,219 @@ settings = get_app_settings()
 converter = Converter()
 
 
-def create_audit_record(audit_record_json: dict, authorization: any):
+# HTTP/2 needs the optional h2 package (httpx[http2]), without it the pool speaks HTTP/1.1 keep-alive
+try:
+    import h2  # noqa: F401
+
+    AUDIT_HTTP2 = True
+except ImportError:
+    AUDIT_HTTP2 = False
+
+AUDIT_TIMEOUT = httpx.Timeout(
+    float(getattr(settings, "AUDIT_TIMEOUT_SECONDS", 5)),
+    connect=float(getattr(settings, "AUDIT_CONNECT_TIMEOUT_SECONDS", 2)),
+)
+AUDIT_LIMITS = httpx.Limits(
+    max_connections=int(getattr(settings, "AUDIT_MAX_CONNECTIONS", 20)),
+    max_keepalive_connections=int(getattr(settings, "AUDIT_MAX_KEEPALIVE", 10)),
+    keepalive_expiry=30,
+)
+AUDIT_RETRIES = int(getattr(settings, "AUDIT_RETRIES", 3))
+AUDIT_BACKOFF_SECONDS = float(getattr(settings, "AUDIT_BACKOFF_SECONDS", 0.2))
+# statuses worth another try, a 400 stays a 400
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def new_audit_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=AUDIT_HTTP2,
+        timeout=AUDIT_TIMEOUT,
+        limits=AUDIT_LIMITS,
+    )
+
+
+class AuditClient:
+    """Connection pool of the audit service, shared by every audit record.
+
+    `start` it in the app lifespan: it opens one httpx.AsyncClient (keep-alive,
+    HTTP/2 when available, timeouts) on the app's event loop. `submit` is fire
+    and forget and safe from any thread, e.g. the SQLAlchemy event listeners,
+    the record is posted on the loop instead of on a new thread. `stop` waits
+    for the records still in flight and closes the pool.
+
+    The host app mounts it with `mount_audit_client(app)` (done by
+    `event_listner(app)`) or `FastAPI(lifespan=audit_client_lifespan)`.
+    Records submitted while the pool is not started (no lifespan, scripts)
+    start it on an event loop of its own in a daemon thread, so the caller
+    never waits for the audit service either way; `stop`, or `close` at
+    interpreter exit, shuts that loop and thread down again.
+    """
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: set = set()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    async def start(self):
+        if self.client is None:
+            self.client = new_audit_http_client()
+            self._loop = asyncio.get_running_loop()
+
+    async def _close(self, timeout: float):
+        pending = [asyncio.wrap_future(future) for future in list(self._pending)]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        await self.client.aclose()
+        self.client = None
+
+    async def stop(self, timeout: float = 10):
+        if self.client is None:
+            return
+        if self._thread is None:
+            await self._close(timeout)
+            self._loop = None
+            return
+        # the pool lives on the background loop, close it there
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._close(timeout), self._loop))
+        self._stop_background()
+
+    def close(self, timeout: float = 10):
+        """Blocking `stop` of a pool started in the background, runs at interpreter exit"""
+        with self._start_lock:
+            if self.client is None or self._thread is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._close(timeout), self._loop).result()
+            self._stop_background()
+
+    def _stop_background(self):
+        loop, thread = self._loop, self._thread
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._loop, self._thread = None, None
+
+    def _start_in_background(self):
+        with self._start_lock:
+            if self.client is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="audit-client", daemon=True)
+            self._thread.start()
+            # only builds the client, no network round trip
+            asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        logging.warning("Audit client was not started with the app, running it on its own thread")
+
+    def _done(self, future):
+        self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Error: {future.exception()}")
+
+    def submit(self, audit_record_json: dict, authorization: any):
+        """Post the audit record in the background
+
+        Args:
+            audit_record_json (dict): the audit record
+            authorization (any): Authorization header of the request that changed the data
+        """
+        if self.client is None:
+            self._start_in_background()
+        future = asyncio.run_coroutine_threadsafe(
+            create_audit_record(audit_record_json, authorization, self.client), self._loop
+        )
+        self._pending.add(future)
+        future.add_done_callback(self._done)
+
+
+audit_client = AuditClient()
+# records still in flight on the background loop are posted before the process exits
+atexit.register(audit_client.close)
+
+
+@asynccontextmanager
+async def audit_client_lifespan(app):
+    """FastAPI lifespan that opens the audit connection pool for the app's lifetime"""
+    await audit_client.start()
+    try:
+        yield
+    finally:
+        await audit_client.stop()
+
+
+def mount_audit_client(app):
+    """Run the audit connection pool for the lifetime of `app`
+
+    Wraps the lifespan the app already has, so the pool is started before
+    and stopped after it.
+
+    Args:
+        app (FastAPI): the host app
+    """
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with audit_client_lifespan(app):
+            async with app_lifespan(app) as state:
+                yield state
+
+    app.router.lifespan_context = lifespan
+
+
+async def create_audit_record(
+    audit_record_json: dict,
+    authorization: any,
+    client: Optional[httpx.AsyncClient] = None,
+):
     """
     Create an audit record by making an HTTP POST request to a specified audit service URL
     using the Authorization header from the provided HTTP request.
 
     Args:
         audit_record_json (dict): A JSON dictionary representing the audit record data.
-        request (Request): An HTTP request object containing headers, including the Authorization header.
-
-    Raises:
-        httpx.RequestError: If an error occurs while making the HTTP request.
+        authorization (any): The Authorization header of the request that changed the data.
+        client (Optional[httpx.AsyncClient]): The pooled client to post with. Without one a
+            client is opened for this record only.
 
     Notes:
-        This function constructs an HTTP POST request with the provided audit record JSON
-        and extracts the Authorization header from the given HTTP request to set it in
-        the headers of the new request. It sends the request to the audit service URL
-        and handles the response status code appropriately.
+        Connection errors, timeouts and 429 / 502 / 503 / 504 responses are retried up to
+        AUDIT_RETRIES times with exponential backoff and full jitter, so a burst of records
+        that failed together does not retry in lockstep. Failures are logged, never raised.
 
     Example:
-        To create an audit record, you can call this function as follows:
-        create_audit_record(audit_record_json, request)
+        To create an audit record from outside the event loop, submit it:
+        audit_client.submit(audit_record_json, authorization)
     """
+    if client is None:
+        async with new_audit_http_client() as client:
+            return await create_audit_record(audit_record_json, authorization, client)
 
-    try:
-        audit_record_url = (
-            f"{settings.AUDIT_SERVICE_URL}{settings.CREATE_AUDIT_RECORD_URL}"
-        )
-
-        headers = {"Authorization": authorization}
-        response = httpx.post(audit_record_url, json=audit_record_json, headers=headers)
-
-        if response.status_code == 201:
-            audit_record = response.json()
-            logging.info(f"Audit record created: {audit_record}")
-        elif response.status_code == 400:
-            error_message = response.json()
-            logging.error(f"Error: {error_message}")
-        else:
-            logging.info(f"Unexpected status code: {response.status_code}")
+    audit_record_url = f"{settings.AUDIT_SERVICE_URL}{settings.CREATE_AUDIT_RECORD_URL}"
+    headers = {"Authorization": authorization}
+    for attempt in range(AUDIT_RETRIES + 1):
+        try:
+            response = await client.post(audit_record_url, json=audit_record_json, headers=headers)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == AUDIT_RETRIES:
+                break
+            logging.info(f"Audit service answered {response.status_code}, retrying")
+        except httpx.RequestError as e:
+            if attempt == AUDIT_RETRIES:
+                logging.error(f"Error: {e}")
+                return
+            logging.info(f"Audit record not sent ({e}), retrying")
+        await asyncio.sleep(random.uniform(0, AUDIT_BACKOFF_SECONDS * 2**attempt))
 
-    except httpx.RequestError as e:
-        logging.error(f"Error: {e}")
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    if response.status_code == 201:
+        logging.info(f"Audit record created: {body}")
+    elif response.status_code == 400:
+        logging.error(f"Error: {body}")
+    else:
+        logging.info(f"Unexpected status code: {response.status_code}")
 
 
 def audit_log(mapper, connection, target):
@@ -90,11 +266,8 @@ def audit_log(mapper, connection, target):
 
     print("OPERATION TYPE", operation, "\n")
     authorization = authorization_var.get()
-    # FIRE AND FORGET
-    thread = threading.Thread(
-        target=create_audit_record, args=(audit_record_json, authorization)
-    )
-    thread.start()
+    # FIRE AND FORGET, on the shared audit connection pool
+    audit_client.submit(audit_record_json, authorization)
     # create_audit_record(audit_record_json)
 
 
@@ -120,19 +293,24 @@ def audit_delete(mapper, connection, target):
     )
     authorization = authorization_var.get()
 
-    # FIRE AND FORGET
-    thread = threading.Thread(
-        target=create_audit_record, args=(audit_record_json, authorization)
-    )
-    thread.start()
+    # FIRE AND FORGET, on the shared audit connection pool
+    audit_client.submit(audit_record_json, authorization)
 
 
-def event_listner():
+def event_listner(app=None):
+    """Audit every Passenger and ShipCallManifest change
+
+    Args:
+        app (FastAPI): the host app, its lifespan gets the audit connection
+            pool; without it the pool starts on a thread of its own
+    """
     if (
         settings.CREATE_AUDIT_RECORD_FLAG == "1"
         or settings.CREATE_AUDIT_RECORD_FLAG == 1
     ):
         print("--------------LISTENDING TO AUDIT--------------")
+        if app is not None:
+            mount_audit_client(app)
         event.listen(Passenger, "before_insert", audit_log)
         event.listen(Passenger, "before_update", audit_log)
         event.listen(Passenger, "before_delete", audit_delete)
@@ -0,0 +1,164 @@
+"""Bounded asynchronous pipeline that takes logging and auditing off the request path"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("root")
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class LogPipeline:
+    """Queue of log / audit records drained in batches by one background worker.
+
+    Requests only `submit` a record, the worker hands up to `batch_size`
+    records at a time to `handler` in a thread, so formatting, span export
+    and mail never run on the event loop or inside request latency.
+
+    The queue holds at most `max_size` records. When it is full the `policy`
+    decides:
+
+    - ``drop_newest``: the new record is dropped, requests never wait
+    - ``drop_oldest``: the oldest queued record is dropped for the new one
+    - ``block``: the request waits up to `block_timeout` seconds for room
+      (backpressure), then the record is dropped
+
+    Every dropped record is counted in `dropped` and passed to `on_drop`,
+    for records holding something that must be released, like an open span.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[dict]], None],
+        max_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        policy: str = DROP_NEWEST,
+        block_timeout: float = 0.05,
+        on_drop: Optional[Callable[[dict], None]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown log queue policy {policy!r}, choose from {POLICIES}")
+        self.handler = handler
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_drop = on_drop
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed_batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the worker on the running event loop, safe to call more than once"""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._worker.get_loop() is loop:
+            return
+        # first start, or the loop of the old worker is gone: records it left queued move over
+        queue = asyncio.Queue(maxsize=self.max_size)
+        while self._queue is not None and not self._queue.empty():
+            queue.put_nowait(self._queue.get_nowait())
+        self._queue = queue
+        self._worker = loop.create_task(self._drain())
+
+    async def stop(self):
+        """Flush what is queued and stop the worker, call it from the app shutdown"""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def _drop(self, record: dict):
+        self.dropped += 1
+        if self.on_drop is not None:
+            try:
+                self.on_drop(record)
+            except Exception as e:
+                logger.error(f"Log pipeline drop handler failed: {e}")
+        # one warning per 1000 drops, a full queue must not flood the log it feeds
+        if self.dropped % 1000 == 1:
+            logger.warning(f"Log pipeline full ({self.policy}), {self.dropped} records dropped so far")
+
+    async def submit(self, record: dict) -> bool:
+        """Queue `record` for the worker
+
+        Args:
+            record (dict): passed to the handler as one item of a batch
+
+        Returns:
+            bool: False if the record was dropped
+        """
+        self.start()
+        self.submitted += 1
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == DROP_OLDEST:
+            oldest = self._queue.get_nowait()
+            self._queue.task_done()
+            self._drop(oldest)
+            self._queue.put_nowait(record)
+            return True
+        if self.policy == BLOCK:
+            try:
+                await asyncio.wait_for(self._queue.put(record), timeout=self.block_timeout)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        self._drop(record)
+        return False
+
+    async def _next_batch(self) -> List[dict]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _drain(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await asyncio.to_thread(self.handler, batch)
+                self.processed += len(batch)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"Log pipeline handler failed for {len(batch)} records: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Counters for a metrics endpoint, `dropped` is the records lost to a full queue"""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "policy": self.policy,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+        }
@@ -1,213 +1,322 @@
 """This module includes middlewares"""
 
-import ast
 from fastapi import Request, HTTPException, Depends
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from src.core.config import get_app_settings
-from starlette.responses import StreamingResponse
+from starlette.datastructures import MutableHeaders
 import logging
-from starlette.concurrency import iterate_in_threadpool
 from fastapi import FastAPI, Request, Response
+from src.middlewares.alerting import ErrorAlerter, SMTPSender, parse_recipients, trace_link
+from src.middlewares.log_pipeline import DROP_NEWEST, LogPipeline
 from src.middlewares.tracing import (
     Tracing,
     logger,
     trace_id_var,
     authorization_var,
-    parent_span_id_var,
     tracer,
 )
 import json
-import uuid
 import time
 from contextvars import ContextVar
 from src.utils.send_email import send_multiple_email
 from opentelemetry.trace import SpanContext, TraceFlags
 from opentelemetry.trace.propagation import set_span_in_context
 from opentelemetry.sdk.trace.export import ConsoleSpanExporter, BatchSpanProcessor
-from opentelemetry.trace import NonRecordingSpan
+from opentelemetry.trace import NonRecordingSpan, SpanKind, Status, StatusCode
 from src.core.config import AppSettings
 from typing import Dict, List, Optional
 import secrets
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.responses import HTMLResponse, JSONResponse
-from starlette.types import Receive, Send, Scope
+from starlette.types import ASGIApp, Message, Receive, Send, Scope
 
 settings = get_app_settings()
 header_var = ContextVar("header_var", default="")
 x_system_user_id = ContextVar("x_system_user_id", default="")
+# bytes of each request / response body kept for the logs, the rest streams past unlogged
+MAX_BODY_LOG_BYTES = int(getattr(settings, "MAX_BODY_LOG_BYTES", 4096))
 
 
-class LogRequestResponseMiddleware(BaseHTTPMiddleware):
-    """Middleware for logging"""
+class BodyCapture:
+    """First `limit` bytes of a body that streams past, for logging.
 
-    async def set_body(self, request: Request, body: bytes):
-        """Helper Function
+    Chunks are only copied up to the limit, the rest is counted and passed on,
+    so a large upload or a streamed export is never held in memory.
+    """
 
-        Args:
-            request (Request): _description_
-            body (bytes): _description_
-        """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self._head = bytearray()
 
-        async def receive():
-            return {"type": "http.request", "body": body}
+    def add(self, chunk: bytes):
+        if len(self._head) < self.limit:
+            self._head += chunk[: self.limit - len(self._head)]
+        self.size += len(chunk)
 
-        request._receive = receive
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self._head)
 
-    async def get_body(self, request: Request) -> bytes:
-        body = await request.body()
-        await self.set_body(request, body)
-        return body
+    def text(self) -> str:
+        text = self._head.decode("utf-8", errors="ignore")
+        if self.truncated:
+            text += f"... [{self.size} bytes]"
+        return text
 
-    async def dispatch(self, request: Request, call_next):
-        """Dispatcher class for logging
 
-        Args:
-            request (Request): the request object
-            call_next (_type_): function
+def write_request_logs(records: List[dict]):
+    """Log, audit and trace a batch of finished requests, runs on the log pipeline worker
 
-        Returns:
-            _type_: Response type, streaming or non-streaming
-        """
+    Args:
+        records (List[dict]): records submitted by LogRequestResponseMiddleware
+    """
+    for record in records:
         try:
-            start_time = time.time()
-            with tracer.start_as_current_span(request.url.path) as span:
-                trace_id = span.get_span_context().trace_id
-                shared_trace_id = format(trace_id, "032x")
-                # shared_trace_id = f"{shared_trace_id[:8]}-{shared_trace_id[8:]}"
-                trace_id_var.set(shared_trace_id)
+            write_request_log(record)
+        except Exception as e:
+            print("Exception ------>", e)
 
-            try:
-                # Setting the authorization if exist
-                header_var.set(
-                    {
-                        key: val
-                        for key, val in request.headers.items()
-                        if key != "authorization"
-                    }
-                )
-                authorization_var.set(request.headers["authorization"])
-            except Exception as e:
-                print("Exception ----------->", e)
 
-            try:
-                x_system_user_id.set(request.headers["x_system_user_id"])
-            except:
-                pass
+def write_request_log(record: dict):
+    trace_id = record["trace_id"]
+    shared_trace_id = format(trace_id, "032x")
+    endpoint = record["endpoint"]
+    request_text = record["request_body"].text()
+    span = record["span"]
+    t = Tracing()
+    span_id = format(span.get_span_context().span_id, "016x")
+
+    if record["cancelled"]:
+        # the client went away or the server shut down before a response, not a server error
+        logger.info(f"Request cancelled: {endpoint}, TraceID: {shared_trace_id}\n")
+        t.audit(
+            trace_id,
+            span_id,
+            "",
+            endpoint,
+            record["start_time"],
+            record["end_time"],
+            request_text,
+            "",
+            "cancelled",
+            record["end_time"] - record["start_time"],
+            "cancelled",
+            span=span,
+        )
+        span.set_attribute("http.cancelled", True)
+        if record["status_code"] is not None:
+            span.set_attribute("http.status_code", record["status_code"])
+        end_request_span(record)
+        return
+
+    if record["exception"] is not None:
+        t.audit(
+            trace_id,
+            span_id,
+            "",
+            endpoint,
+            record["start_time"],
+            record["end_time"],
+            request_text,
+            "",
+            "500",
+            record["end_time"] - record["start_time"],
+            record["exception"],
+            span=span,
+        )
+        span.set_attribute("input_args", request_text)
+        span.set_status(Status(StatusCode.ERROR, record["exception"]))
+        end_request_span(record)
+        LogRequestResponseMiddleware.send_error_email(endpoint, record["status_code"] or 500, trace_id)
+        return
+
+    response_text = record["response_body"].text()
+    response_status_code = record["status_code"]
+    time_spent = record["end_time"] - record["start_time"]
+    logger.info(f"API endpoint: {endpoint}, TraceID: {shared_trace_id}\n")
+    logger.info(f"Request payload: {request_text}, TraceID: {shared_trace_id}\n")
+    logger.info(f"Response payload: {response_text}, TraceID: {shared_trace_id}\n")
+    logger.info(
+        f"Response status code: {response_status_code}, TraceID: {shared_trace_id}\n"
+    )
+    extra = {
+        "SERVICE_NAME": "PASSENGERS-SERVICE",
+        "TRACE_ID": shared_trace_id,
+        "HTTP_ENDPOINT": endpoint,
+        "DURATION": time_spent,
+        "METHOD": record["method"],
+        "STATUS_CODE": response_status_code,
+    }
+    logger.info(f"API INFO: {extra}")
+    t.audit(
+        trace_id,
+        span_id,
+        "",
+        endpoint,
+        record["start_time"],
+        record["end_time"],
+        request_text,
+        response_text,
+        response_status_code,
+        time_spent,
+        "",
+        span=span,
+    )
+
+    # Add request-level attributes
+    if response_status_code is not None:
+        span.set_attribute("http.status_code", response_status_code)
+    span.set_attribute("input_args", request_text)
+    span.set_attribute("output_args", response_text)
+    if response_status_code is not None and response_status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+    end_request_span(record)
+
+    LogRequestResponseMiddleware.send_error_email(endpoint, response_status_code, trace_id)
+
+
+def end_request_span(record: dict):
+    """End the request's server span at the time the response finished"""
+    record["span"].end(end_time=int(record["end_time"] * 1e9))
+
+
+def send_error_alert(recipients: List[str], subject: str, message: str):
+    send_multiple_email(email=recipients, subject=subject, message=message)
+
+
+# 5xx alert mails, grouped per endpoint and status and rate limited; ALERT_SMTP_HOST
+# sends them to that SMTP server instead, e.g. an alerting.SMTPStub in tests
+error_alerter = ErrorAlerter(
+    SMTPSender(settings.ALERT_SMTP_HOST, int(getattr(settings, "ALERT_SMTP_PORT", 25)))
+    if getattr(settings, "ALERT_SMTP_HOST", None)
+    else send_error_alert,
+    parse_recipients(settings.ERROR_EMAILS),
+    region=settings.REGION,
+    window=float(getattr(settings, "ALERT_WINDOW_SECONDS", 300)),
+    max_emails=int(getattr(settings, "ALERT_MAX_EMAILS_PER_WINDOW", 10)),
+)
 
-            # Log the API endpoint
-            endpoint = request.url.path
+# logs, audits and spans of every request are written off the request path by this worker
+log_pipeline = LogPipeline(
+    write_request_logs,
+    on_drop=end_request_span,
+    max_size=int(getattr(settings, "LOG_QUEUE_SIZE", 10000)),
+    batch_size=int(getattr(settings, "LOG_BATCH_SIZE", 100)),
+    flush_interval=float(getattr(settings, "LOG_FLUSH_INTERVAL", 0.5)),
+    policy=getattr(settings, "LOG_QUEUE_POLICY", DROP_NEWEST),
+)
 
-            # Setting the request payload
-            await self.set_body(request, await request.body())
-            request_body = await self.get_body(request)
-            logger.info(f"API endpoint: {endpoint}, TraceID: {shared_trace_id}\n")
-            logger.info(
-                f"Request payload: {request_body.decode('utf-8', errors='ignore')}, TraceID: {shared_trace_id}\n"
-            )
 
-            # Process the request and get the response
-            response = await call_next(request)
+class LogRequestResponseMiddleware:
+    """Pure ASGI middleware for logging.
 
-            # Log the response body and status code
-            response_text = ""
-            if isinstance(response, StreamingResponse):
-                # Log the body in chunks for streaming responses
-                response_body = [chunk async for chunk in response.body_iterator]
-                response.body_iterator = iterate_in_threadpool(iter(response_body))
-                if response_body:
-                    response_text = response_body[0].decode("utf-8")
-            else:
-                # Log the entire response body for non-streaming responses
-                response_body = await response.body()
-                response_text = response_body.decode("utf-8")
-            response.headers["Trace-ID"] = str(trace_id)
-            response_status_code = response.status_code
-            logger.info(
-                f"Response payload: {response_text}, TraceID: {shared_trace_id}\n"
-            )
-            logger.info(
-                f"Response status code: {response_status_code}, TraceID: {shared_trace_id}\n"
-            )
-            end_time = time.time()
-            time_spent = end_time - start_time
-            t = Tracing()
-            span_id = str(uuid.uuid4())
-            parent_span_id_var.set(span_id)
-            extra = {
-                "SERVICE_NAME": "PASSENGERS-SERVICE",
-                "TRACE_ID": shared_trace_id,
-                "HTTP_ENDPOINT": endpoint,
-                "DURATION": time_spent,
-                "METHOD": request.method,
-                "STATUS_CODE": response_status_code,
-            }
-            logger.info(f"API INFO: {extra}")
-            t.audit(
-                trace_id,
-                span_id,
-                "",
-                endpoint,
-                start_time,
-                end_time,
-                request_body.decode("utf-8", errors="ignore"),
-                response_text,
-                response_status_code,
-                time_spent,
-                "",
-            )
+    Request and response bodies are teed as their chunks pass through
+    `receive` and `send`: nothing is buffered or re-wrapped, streaming
+    responses keep streaming, and at most `max_body_log_bytes` of each body
+    is kept for the logs and the audit trail.
 
-            with tracer.start_as_current_span(request.url.path) as span:
-                # Add request-level attributes
-                span.set_attribute("http.method", request.method)
-                span.set_attribute("http.path", str(request.url.path))
+    Each request gets exactly one server span around the app, so spans the
+    handler opens are its children and the trace connects. The request path
+    only sets the context vars and queues one record on `pipeline`; logging,
+    the audit events and attributes on that span, ending it and error mail
+    happen on its background worker. Stop the pipeline and then
+    error_alerter in the app shutdown to flush them.
+    """
 
-                span.set_attribute("http.status_code", response_status_code)
-                span.set_attribute(
-                    "input_args", request_body.decode("utf-8", errors="ignore")
-                )
-                span.set_attribute("output_args", response_text)
-                logger.info(
-                    f"Custom trace_id {trace_id} {span.get_span_context().trace_id} {request.url.path}"
-                )
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_body_log_bytes: int = MAX_BODY_LOG_BYTES,
+        pipeline: LogPipeline = log_pipeline,
+    ):
+        self.app = app
+        self.max_body_log_bytes = max_body_log_bytes
+        self.pipeline = pipeline
 
-                self.send_error_email(endpoint, response_status_code, trace_id)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Capture one HTTP request and queue its log record
 
-            return response
-        except Exception as e:
-            print("Exception ------>", e)
-            end_time = time.time()
-            time_spent = end_time - start_time
-            t = Tracing()
-            span_id = str(uuid.uuid4())
-            parent_span_id_var.set(span_id)
-            t.audit(
-                trace_id,
-                span_id,
-                "",
-                endpoint,
-                start_time,
-                end_time,
-                str(request_body.decode("utf-8", errors="ignore")),
-                "",
-                "500",
-                time_spent,
-                str(e),
-            )
-            raise e
+        Args:
+            scope (Scope): the ASGI connection scope
+            receive (Receive): channel of the request body messages
+            send (Send): channel of the response messages
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        error_alerter.start()
+        request = Request(scope)
+        record = {
+            "endpoint": request.url.path,
+            "method": request.method,
+            "start_time": time.time(),
+            # None until http.response.start was sent
+            "status_code": None,
+            "request_body": BodyCapture(self.max_body_log_bytes),
+            "response_body": BodyCapture(self.max_body_log_bytes),
+            "exception": None,
+            "cancelled": False,
+        }
 
-    def send_error_email(self, endpoint, response_status_code, trace_id):
-        if response_status_code >= 500:
-            trace_id = f"1-{format(trace_id, '032x')}"
-            trace_id = f"{trace_id[:10]}-{trace_id[10:]}"
-            log_link = f"https://console.aws.amazon.com/cloudwatch/home?region={settings.REGION}#xray:traces/{trace_id}"
+        # Setting the authorization if exist
+        header_var.set(
+            {key: val for key, val in request.headers.items() if key != "authorization"}
+        )
+        if "authorization" in request.headers:
+            authorization_var.set(request.headers["authorization"])
+        if "x_system_user_id" in request.headers:
+            x_system_user_id.set(request.headers["x_system_user_id"])
+
+        async def receive_and_capture() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                record["request_body"].add(message.get("body", b""))
+            return message
+
+        async def capture_and_send(message: Message):
+            if message["type"] == "http.response.start":
+                record["status_code"] = message["status"]
+                MutableHeaders(scope=message).append("Trace-ID", str(trace_id))
+            elif message["type"] == "http.response.body":
+                record["response_body"].add(message.get("body", b""))
+            await send(message)
+
+        # the one span of this request, spans opened by the handler are its children
+        with tracer.start_as_current_span(
+            request.url.path,
+            kind=SpanKind.SERVER,
+            start_time=int(record["start_time"] * 1e9),
+            attributes={"http.method": request.method, "http.path": request.url.path},
+            end_on_exit=False,
+        ) as span:
+            trace_id = span.get_span_context().trace_id
+            trace_id_var.set(format(trace_id, "032x"))
+            record["trace_id"] = trace_id
+            record["span"] = span
+            try:
+                await self.app(scope, receive_and_capture, capture_and_send)
+            except Exception as e:
+                record["exception"] = str(e)
+                raise e
+            except BaseException:
+                # asyncio.CancelledError of a disconnect or shutdown, logged but never alerted
+                record["cancelled"] = True
+                raise
+            finally:
+                record["end_time"] = time.time()
+                # the pipeline worker adds the audit events and attributes, then ends the span
+                await self.pipeline.submit(record)
+
+    @staticmethod
+    def send_error_email(endpoint, response_status_code, trace_id):
+        """Queue a 5xx response for the error alert mails, error_alerter groups and sends them"""
+        if response_status_code is not None and response_status_code >= 500:
             logger.info(
-                f"Mailing error log, with the status code: {response_status_code}\tEndpoint: {endpoint}\t{log_link}"
-            )
-            send_multiple_email(
-                email=ast.literal_eval(settings.ERROR_EMAILS),
-                subject=f"JMBAXI Error code {response_status_code} in {endpoint}",
-                message=f"Trace link: {log_link}",
+                f"Queued error alert, with the status code: {response_status_code}\tEndpoint: {endpoint}\t{trace_link(trace_id, settings.REGION)}"
             )
+            error_alerter.report(endpoint, response_status_code, trace_id)
 
 
 class AuditMiddleware(BaseHTTPMiddleware):
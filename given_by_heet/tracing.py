@@ -9,6 +9,7 @@ from contextvars import ContextVar
 import logging
 from src.core.config import get_app_settings
 from datetime import datetime
+from typing import Optional
 
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace import TracerProvider
@@ -18,7 +19,7 @@ from opentelemetry import trace
 from opentelemetry.trace import SpanKind
 from opentelemetry.trace import SpanContext, TraceFlags
 from opentelemetry.trace.propagation import set_span_in_context
-from opentelemetry.trace import NonRecordingSpan
+from opentelemetry.trace import NonRecordingSpan, Span
 from opentelemetry.sdk.trace.export import ConsoleSpanExporter
 from requests.exceptions import ReadTimeout
 from opentelemetry.sdk.trace.export import SpanExportResult
@@ -101,7 +102,15 @@ class Tracing:
         status: any,
         duration: float,
         exception: any,
+        span: Optional[Span] = None,
     ) -> bool:
+        """Log a trace record and add its started / completed events to a span
+
+        Args:
+            span (Optional[Span]): span the events are added to, e.g. the
+                request's server span. Without one a child span of the current
+                span is opened for them.
+        """
         try:
             trace_data = {
                 "trace_id": f"{trace_id}",
@@ -117,21 +126,11 @@ class Tracing:
                 "exception": exception,
             }
 
-            with tracer.start_as_current_span(name) as span:
-                span.add_event(
-                    f"{name} started",
-                    {"timestamp": datetime.fromtimestamp(start_time).isoformat()},
-                )
-                # Add duration to the span
-                span.add_event(
-                    f"{name} completed",
-                    {
-                        "timestamp": datetime.fromtimestamp(end_time).isoformat(),
-                        "duration_in_seconds": duration,
-                        "input_args": str(input_args),
-                        "output_args": str(output_args),
-                    },
-                )
+            if span is None:
+                with tracer.start_as_current_span(name) as span:
+                    self._add_events(span, name, start_time, end_time, input_args, output_args, duration)
+            else:
+                self._add_events(span, name, start_time, end_time, input_args, output_args, duration)
 
             logger.info(f"{trace_data}\n")
 
@@ -144,6 +143,25 @@ class Tracing:
             print("Exception ----------->", e)
             return False
 
+    @staticmethod
+    def _add_events(span: Span, name, start_time, end_time, input_args, output_args, duration):
+        span.add_event(
+            f"{name} started",
+            {"timestamp": datetime.fromtimestamp(start_time).isoformat()},
+            timestamp=int(start_time * 1e9),
+        )
+        # Add duration to the span
+        span.add_event(
+            f"{name} completed",
+            {
+                "timestamp": datetime.fromtimestamp(end_time).isoformat(),
+                "duration_in_seconds": duration,
+                "input_args": str(input_args),
+                "output_args": str(output_args),
+            },
+            timestamp=int(end_time * 1e9),
+        )
+
 
 def trace_decorator(func):
     @wraps(func)
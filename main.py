@@ -1,65 +1,176 @@
-from fastapi import FastAPI, Path, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Path, HTTPException, Query, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from functools import partial
+from pydantic import ValidationError
+from typing import Literal, Optional
 import json
 import logging
 from schema.pydantic_model import Patient, Patient_update, Patient_create
+from schema import batch_vitals
+from schema.adapters import PATIENT_LIST
+from store.async_store import AsyncPatientRepository, StoreBusy
+from store.base import PreconditionFailed, decode_cursor, encode_cursor, page_key, record_etag
+from store.repository import create_repository
+from store.response_cache import ResponseCache, etag_in
+from store import codec, columnar
 
 
-app = FastAPI()
+# PATIENT_BACKEND=json: ek hi baar json load hota hai startup pe, phir saare reads memory se
+# PATIENT_BACKEND=sqlite: indexed patients.db (json se laane ke liye: python -m store.migrate import patients.json patients.db)
+patient_store = create_repository()
+# async endpoints store ko isi ke through use karte hain: har call apne bounded I/O executor pe,
+# starlette ke 40 thread wale pool pe nahi (PATIENT_IO_WORKERS, PATIENT_IO_QUEUE)
+async_store = AsyncPatientRepository(patient_store)
+# /view, /patient, /sort ke serialized responses, har write pe sirf affected entries hatati hai
+# dusre uvicorn worker ke writes store ke shared change counter se pata chalte hain, tab poora cache clear
+response_cache = ResponseCache(changes=patient_store.changes)
 
 
-def load_all():
-    with open("patients.json", 'r') as f:
-        data = json.load(f)
-    return data
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await async_store.start()
+    yield
+    # shutdown pe pending writes disk pe flush karo
+    await async_store.stop()
 
 
-def save_all(data):
-    with open("patients.json", "w") as f:
-        json.dump(data, f)
+class CodecJSONResponse(JSONResponse):
+    # orjson / msgspec installed ho toh wahi, warna stdlib json (PATIENT_JSON_CODEC se choose bhi kar sakte hain)
+    def render(self, content) -> bytes:
+        return codec.dumps(content)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=CodecJSONResponse)
+
+
+@app.exception_handler(StoreBusy)
+async def store_busy(request: Request, exc: StoreBusy):
+    # store ki I/O queue bhari hai (slow disk), client thodi der baad retry kare
+    return CodecJSONResponse(status_code=503, content={"message": str(exc)}, headers={"Retry-After": "1"})
 
 
 @app.get("/")
-def home():
+async def home():
     return {
         "message": "Welcome Sharon to your FAST-API server !!!"
     }
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {
         "status" : "OK"
     }
 
 @app.get("/about")
-def about():
+async def about():
     return {
         "message": "I am using CampusX website to learn FastAPI 😎..."
     }
 
 
+async def cached_json(request: Request, response: Response, build, patient_id: Optional[str] = None) -> Response:
+    # same route + same query params => cache se pehle ke serialized bytes, build() (store read + encode) nahi chalta
+    # patient_id: ye response sirf isi patient ka hai, baaki responses kisi bhi write pe invalidate hote hain
+    key = ResponseCache.key(request.url.path, request.query_params.multi_items())
+    entry = response_cache.get(key)
+    cache_status = "HIT"
+    if entry is None:
+        cache_status = "MISS"
+        version = response_cache.version
+        # store ke records pehle se plain json dicts hain, jsonable_encoder ka poora walk skip karke seedha encode
+        # build() (store read) aur encode dono store ke I/O executor pe, event loop block nahi hota
+        body = await async_store.run(lambda: codec.dumps(build()))
+        # build() jo headers (X-Next-Cursor, ETag) injected response pe set karta hai woh bhi entry mein save hote hain
+        entry = response_cache.put(key, body, response.headers, version, patient_id)
+
+    headers = {**entry.headers, "ETag": entry.etag, "X-Cache": cache_status}
+    # client ke paas same version hai toh body bhejne ki zaroorat nahi
+    if etag_in(request.headers.get("if-none-match"), entry.etag):
+        response_cache.count("not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def fetch_page(response: Response, field: str, descending: bool, limit: Optional[int], offset: int, cursor: Optional[str]):
+    # cursor (keyset) pagination: agla page pichhle page ke last patient ke baad se shuru hota hai
+    try:
+        after = decode_cursor(field, cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = patient_store.page(field, descending, limit=limit, offset=offset, after=after)
+
+    # page bhara hua hai toh aage aur data ho sakta hai, next cursor header mein bhejo
+    if limit is not None and len(items) == limit:
+        last_id, last_record = items[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(field, page_key(last_id, last_record, field))
+    return items
+
+
 @app.get("/view")
-def view():
-    return load_all()
+async def view(request: Request, response: Response,
+         limit: Optional[int] = Query(None, ge=1, description="Max patients in this page, default is everything"),
+         offset: int = Query(0, ge=0, description="Patients to skip"),
+         cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page")):
+    def build():
+        if limit is None and offset == 0 and cursor is None:
+            return patient_store.all()
+
+        # pages are ordered by patient id
+        return dict(fetch_page(response, "id", False, limit, offset, cursor))
+
+    return await cached_json(request, response, build)
+
+
+async def export_ndjson():
+    # har line ek patient, client pehli line aate hi process shuru kar sakta hai
+    async for chunk in async_store.iter_all():
+        yield b"".join(codec.dumps({"id": patient_id, **record}) + b"\n" for patient_id, record in chunk)
+
+
+async def export_json_array():
+    # same as /view ka data, lekin ek saath poora dict nahi banta, chunk by chunk jaata hai
+    separator = b"{"
+    async for chunk in async_store.iter_all():
+        yield separator + b",".join(codec.dumps(patient_id) + b":" + codec.dumps(record) for patient_id, record in chunk)
+        separator = b","
+    yield b"}" if separator == b"," else b"{}"
+
+
+@app.get("/export")
+async def export_patients(format: Literal["ndjson", "json"] = Query("ndjson", description="ndjson: one patient per line, json: same object as /view")):
+    if format == "ndjson":
+        return StreamingResponse(export_ndjson(), media_type="application/x-ndjson")
+    return StreamingResponse(export_json_array(), media_type="application/json")
 
 
 # example of path parameter 
 @app.get('/patient/{patient_id}')
-def patient(patient_id : str = Path(..., description="Please enter the patient ID you are looking for ", examples="P001")):
-    data = load_all()
+async def patient(request: Request, response: Response, patient_id : str = Path(..., description="Please enter the patient ID you are looking for ", examples="P001")):
+    def build():
+        record = patient_store.get(patient_id)
+
+        if record is not None:
+            # ETag ko If-Match mein bhej ke /edit safe update kar sakte hain (If-None-Match pe 304 bhi isi se)
+            response.headers["ETag"] = record_etag(record)
+            return {
+                'message': 'patient found',
+                'data': record
+            }
+        raise HTTPException(status_code=404, detail="Patient not found")
 
-    if patient_id in data:
-        return {
-            'message': 'patient found',
-            'data': data[patient_id]
-        }
-    raise HTTPException(status_code=404, detail="Patient not found")
+    return await cached_json(request, response, build, patient_id=patient_id)
 
 
 # example of Query parameter
 @app.get('/sort')
-def sorted_data(order_by : str = Query(..., description="Enter the attribute by which you want to sort"), descending : bool = Query(True, description="Enter False if want data in ascending order i.e smallest first else default is descending")):
+async def sorted_data(request: Request, response: Response,
+                order_by : str = Query(..., description="Enter the attribute by which you want to sort"), descending : bool = Query(True, description="Enter False if want data in ascending order i.e smallest first else default is descending"),
+                limit: Optional[int] = Query(None, ge=1, description="Only the first `limit` patients, e.g. the 10 heaviest"),
+                offset: int = Query(0, ge=0, description="Patients to skip"),
+                cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page")):
 
     valid_attributes = ["height", "weight", "bmi"]
 
@@ -69,86 +180,285 @@ def sorted_data(order_by : str = Query(..., description="Enter the attribute by
     # agar ascending field mein kuch galat daala toh kya karna hai ?? 
     # code here .... / if needed 
 
-    data = load_all()
-
-    sorted_data = sorted(data.values(), key = lambda x : x.get(order_by, 0), reverse=descending)
-    logging.log(level=1, msg="some message from the logger")
-    return sorted_data
+    def build():
+        # json backend pehle se sorted index walk karta hai, sqlite backend indexed ORDER BY ... LIMIT
+        # sirf first K chahiye toh sirf K records hi nikalte hain, poora sort nahi hota
+        sorted_data = [record for _, record in fetch_page(response, order_by, descending, limit, offset, cursor)]
+        logging.log(level=1, msg="some message from the logger")
+        return sorted_data
+
+    return await cached_json(request, response, build)
+
+
+@app.get('/patients/search')
+async def search_patients(city: Optional[str] = Query(None, description="Exact city, e.g. Guwahati"),
+                    gender: Optional[Literal['male', 'female', 'others']] = Query(None),
+                    verdict: Optional[Literal['Underweight', 'Normal weight', 'Overweight', 'Obese']] = Query(None),
+                    age_min: Optional[int] = Query(None, ge=0, description="Minimum age, inclusive"),
+                    age_max: Optional[int] = Query(None, ge=0, description="Maximum age, inclusive"),
+                    bmi_min: Optional[float] = Query(None, ge=0, description="Minimum BMI, inclusive"),
+                    bmi_max: Optional[float] = Query(None, ge=0, description="Maximum BMI, inclusive"),
+                    limit: Optional[int] = Query(None, ge=1, description="Max patients to return"),
+                    offset: int = Query(0, ge=0, description="Patients to skip")):
+    # e.g. /patients/search?city=Guwahati&age_min=41&verdict=Obese
+    equals = {field: value for field, value in {"city": city, "gender": gender, "verdict": verdict}.items() if value is not None}
+    ranges = {}
+    if age_min is not None or age_max is not None:
+        ranges["age"] = (age_min, age_max)
+    if bmi_min is not None or bmi_max is not None:
+        ranges["bmi"] = (bmi_min, bmi_max)
+
+    # store sabse chhota (most selective) index choose karta hai, baaki filters us chhoti list pe lagte hain
+    return CodecJSONResponse(dict(await async_store.search(equals, ranges, limit=limit, offset=offset)))
+
+
+@app.get('/analytics')
+async def patient_analytics(group_by: Optional[Literal['city', 'gender']] = Query(None, description="Statistics per city or per gender, default is everyone together"),
+                      bins: int = Query(10, ge=1, le=100, description="Histogram bins per vital")):
+    # height / weight / bmi ka mean, percentiles, histogram aur verdict distribution, numpy se vectorized
+    if columnar.np is None:
+        raise HTTPException(status_code=501, detail={"message": "Analytics need numpy, pip install numpy"})
+
+    # snapshot copy aur numpy ka kaam bhi I/O executor pe, event loop free rehta hai
+    return await async_store.run(lambda: columnar.describe(patient_store.columns(), group_by=group_by, bins=bins))
 
 
 @app.post("/create", response_model=Patient_create)
-def add_patient(patient: Patient):
-    # check whether patient present , if yes then throw error 
-    data = load_all()
-
-    if patient.id in data:
+async def add_patient(patient: Patient):
+    # check whether patient present , if yes then throw error, if no then add patient in the store
+    # check aur add ek saath (atomic) hota hai, taaki do parallel /create ek dusre ko overwrite na karein
+    if not await async_store.insert(patient.id, patient.model_dump(exclude=patient.id, exclude_computed_fields=False)):
         raise HTTPException(400, detail={"message": f"Patient {patient.id} already present in the DB"})
-    
-        # if no then add patient in the json
-    data[patient.id] = patient.model_dump(exclude=patient.id, exclude_computed_fields=False)
+    response_cache.invalidate([patient.id])
 
-        # save the json file
-    save_all(data=data)
-
-    return JSONResponse(content={
+    return CodecJSONResponse(content={
         "message": f"Created patient {patient.id} successfully with verdict {patient.decide_verdict}", 
         "pydantic_response": f"{patient.weight}, {patient.compute_bmi}, {patient.weight}"                         }, status_code=201)
 
     
-@app.put('/edit/{patient_id}')
-def update_patient(patient_id : str, patient_update: Patient_update):
-    pass
-    # load karo saare json ka data and check whether patient is present or not 
-    data = load_all()
-
-    if patient_id not in data:
-        raise HTTPException(status_code=404, detail={
-            "message": f"{patient_id} not present in the DB"
-        })
-    
-    # if yes then uska value json se dict mein lao 
-    existing_patient_data = data[patient_id]
-    # jo data user ne bheja hai usko bhi dict mein lao 
-    updated_patient_data = patient_update.model_dump(exclude_unset=True)
-
-    # data update karo dict mein add save karo json mein 
+def merge_update(patient_id, updated_patient_data, existing_patient_data):
+    # data update karo dict mein (store ka copy milta hai, original record change nahi hota)
     for key, value in updated_patient_data.items():
         existing_patient_data[key] = value
 
     existing_patient_data['id'] = patient_id
     pateint_pydantic_obj = Patient(**existing_patient_data)
-    
-    existing_patient_data = pateint_pydantic_obj.model_dump(exclude={'id'}, exclude_computed_fields=False)
 
-    data[patient_id] = existing_patient_data
+    return pateint_pydantic_obj.model_dump(exclude={'id'}, exclude_computed_fields=False)
+
 
+@app.put('/edit/{patient_id}')
+async def update_patient(patient_id : str, patient_update: Patient_update, if_match: Optional[str] = Header(None, description="ETag from GET /patient/{patient_id}, update fails with 412 if the patient changed since")):
+    # jo data user ne bheja hai usko bhi dict mein lao 
+    updated_patient_data = patient_update.model_dump(exclude_unset=True)
 
-    # store / save data in json 
-    save_all(data)
+    # load, update aur save ek hi patient lock ke andar, taaki parallel edits ek dusre ko overwrite na karein
+    try:
+        existing_patient_data = await async_store.update(patient_id, partial(merge_update, patient_id, updated_patient_data), if_match=if_match)
+    except KeyError:
+        raise HTTPException(status_code=404, detail={
+            "message": f"{patient_id} not present in the DB"
+        })
+    except PreconditionFailed:
+        raise HTTPException(status_code=412, detail={
+            "message": f"{patient_id} was modified by someone else, fetch it again and retry"
+        })
+    response_cache.invalidate([patient_id])
 
-    return JSONResponse(status_code=200, content={'message': f'pateint {patient_id} updated successfully'})
+    return CodecJSONResponse(status_code=200, content={'message': f'pateint {patient_id} updated successfully'},
+                        headers={"ETag": record_etag(existing_patient_data)})
 
 
 @app.delete('/delete/{patient_id}')
-def delete_patient(patient_id: str):
-    # check if patient in json
-    data = load_all()
-    if patient_id not in data:
+async def delete_patient(patient_id: str):
+    # check if patient in store, if yes then delete, json save write-behind task karega
+    try:
+        await async_store.delete(patient_id)
+    except KeyError:
         raise HTTPException(status_code=404, detail={'message': f'patient {patient_id} not in DB'}) 
-
-    # if yes then load data and delete
-    del data[patient_id]
-
-    # save data 
-    save_all(data)
+    response_cache.invalidate([patient_id])
 
     # return response
-    return JSONResponse(status_code=200, content={'message': f'patient {patient_id} deleted succesfully'})
+    return CodecJSONResponse(status_code=200, content={'message': f'patient {patient_id} deleted succesfully'})
+
+# ---------------- bulk APIs ----------------
+# hazaron patients ek request mein: sab ek pass mein validate, har item ka error alag, aur store mein ek hi write
+
+MAX_BULK_ITEMS = 10000
+# ek patient ~200 bytes ka hota hai, MAX_BULK_ITEMS ke liye kaafi jagah; isse bada body parse hi nahi hota
+MAX_BULK_BYTES = 16 * 1024 * 1024
+
+
+def body_too_large():
+    return HTTPException(status_code=413, detail={"message": f"Body larger than {MAX_BULK_BYTES} bytes"})
+
+
+async def read_bulk_body(request: Request) -> bytes:
+    # size pehle check, parse / validate baad mein: Content-Length se turant, chunked body padhte padhte
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_BULK_BYTES:
+        raise body_too_large()
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BULK_BYTES:
+            raise body_too_large()
+    return bytes(body)
+
+
+async def read_bulk_items(request: Request, body: bytes = None) -> list:
+    # body ya toh JSON array hai ya NDJSON (Content-Type: application/x-ndjson, ek line ek item)
+    if body is None:
+        body = await read_bulk_body(request)
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [codec.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = codec.loads(body)
+    except (ValueError, codec.DecodeError):
+        raise HTTPException(status_code=400, detail={"message": "Body must be a JSON array or NDJSON"})
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail={"message": "Body must be a JSON array or NDJSON"})
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail={"message": f"At most {MAX_BULK_ITEMS} items per request"})
+    return items
+
+
+def bulk_error(index, patient_id, detail):
+    return {"index": index, "id": patient_id, "detail": detail}
+
+
+def item_id(item):
+    return item.get("id") if isinstance(item, dict) else None
+
+
+def validate_each(items):
+    # har item alag validate, taaki har galat item ka apna error mile
+    patients, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            patients.append((index, Patient.model_validate(item)))
+        except ValidationError as e:
+            errors.append(bulk_error(index, item_id(item), json.loads(e.json(include_url=False))))
+    return create_many(patients, errors)
+
+
+def create_many(patients, errors):
+    # patients: (index in the body, Patient) pairs
+    records, positions = {}, {}
+    for index, patient in patients:
+        if patient.id in records:
+            errors.append(bulk_error(index, patient.id, "Duplicate id in this batch"))
+            continue
+        # bmi / verdict yahan per patient nahi, neeche poore batch ke liye ek saath compute hote hain
+        records[patient.id] = patient.model_dump(exclude_computed_fields=batch_vitals.np is not None)
+        positions[patient.id] = index
+
+    if batch_vitals.np is not None:
+        batch_vitals.classify_records(list(records.values()))
+
+    for patient_id in patient_store.insert_many(records):
+        errors.append(bulk_error(positions[patient_id], patient_id, f"Patient {patient_id} already present in the DB"))
+        del records[patient_id]
+    response_cache.invalidate(records)
+
+    return {"created": list(records), "errors": sorted(errors, key=lambda error: error["index"])}
+
+
+def update_many(items):
+    applies, positions, errors = {}, {}, []
+    for index, item in enumerate(items):
+        patient_id = item_id(item)
+        if not isinstance(patient_id, str):
+            errors.append(bulk_error(index, None, "Every item needs the id of the patient to edit"))
+            continue
+        if patient_id in applies:
+            errors.append(bulk_error(index, patient_id, "Duplicate id in this batch"))
+            continue
+        try:
+            patient_update = Patient_update.model_validate({key: value for key, value in item.items() if key != "id"})
+        except ValidationError as e:
+            errors.append(bulk_error(index, patient_id, json.loads(e.json(include_url=False))))
+            continue
+        applies[patient_id] = partial(merge_update, patient_id, patient_update.model_dump(exclude_unset=True))
+        positions[patient_id] = index
+
+    for patient_id, error in patient_store.update_many(applies).items():
+        if isinstance(error, KeyError):
+            detail = f"{patient_id} not present in the DB"
+        elif isinstance(error, ValidationError):
+            detail = json.loads(error.json(include_url=False))
+        else:
+            detail = str(error)
+        errors.append(bulk_error(positions[patient_id], patient_id, detail))
+        del applies[patient_id]
+    response_cache.invalidate(applies)
+
+    return {"updated": list(applies), "errors": sorted(errors, key=lambda error: error["index"])}
+
+
+def delete_many(items):
+    # (index, id) pairs: sirf string ids aage jaate hain, dict / list items pe hash nahi hota
+    positions, errors = [], []
+    for index, patient_id in enumerate(items):
+        if not isinstance(patient_id, str):
+            errors.append(bulk_error(index, None, "Items must be patient ids"))
+            continue
+        positions.append((index, patient_id))
+    patient_ids = [patient_id for _, patient_id in positions]
+
+    missing = set(patient_store.delete_many(patient_ids))
+    for index, patient_id in positions:
+        if patient_id in missing:
+            errors.append(bulk_error(index, patient_id, f"patient {patient_id} not in DB"))
+
+    deleted = [patient_id for patient_id in dict.fromkeys(patient_ids) if patient_id not in missing]
+    response_cache.invalidate(deleted)
+    return {"deleted": deleted, "errors": sorted(errors, key=lambda error: error["index"])}
+
+
+# validation CPU ka kaam hai, isliye event loop pe nahi store ke I/O executor mein chalate hain
+@app.post("/bulk/create")
+async def bulk_add_patients(request: Request):
+    """Body: JSON array or NDJSON of Patient objects"""
+    body = await read_bulk_body(request)
+    if "ndjson" not in request.headers.get("content-type", ""):
+        # fast path: poora JSON array ek hi validate_json call mein parse + validate, beech mein dicts nahi bante
+        try:
+            patients = await async_store.run(PATIENT_LIST.validate_json, body)
+        except ValidationError:
+            # koi item (ya body hi) galat hai, neeche wala per item path har error alag batata hai
+            patients = None
+        if patients is not None:
+            if len(patients) > MAX_BULK_ITEMS:
+                raise HTTPException(status_code=413, detail={"message": f"At most {MAX_BULK_ITEMS} items per request"})
+            return await async_store.run(create_many, list(enumerate(patients)), [])
+
+    return await async_store.run(validate_each, await read_bulk_items(request, body))
+
+
+@app.put("/bulk/edit")
+async def bulk_update_patients(request: Request):
+    """Body: JSON array or NDJSON of Patient_update objects, each with the "id" of the patient to edit"""
+    return await async_store.run(update_many, await read_bulk_items(request))
+
+
+@app.post("/bulk/delete")
+async def bulk_delete_patients(request: Request):
+    """Body: JSON array or NDJSON of patient ids"""
+    return await async_store.run(delete_many, await read_bulk_items(request))
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # hits, misses, 304s, evictions aur abhi cache mein kitne entries / bytes hain
+    return response_cache.stats()
+
 
-from fastapi import Request
 @app.get("/req")
-def get_request_packet(req: Request):
-    return JSONResponse(status_code=200, 
+async def get_request_packet(req: Request):
+    return CodecJSONResponse(status_code=200, 
                         content= {
                             "reuest": f"{req}",
                             "req.base_url": f"{req.url}",
@@ -0,0 +1,32 @@
+"""Module level TypeAdapters that validate a whole batch of patients in one call.
+
+Building a TypeAdapter compiles a pydantic-core validator, so they are built
+once at import time and reused. `validate_json` parses and validates the raw
+bytes in a single pass inside pydantic-core, without first materialising the
+intermediate dicts of `json.loads` and then building every Patient from Python.
+"""
+
+from typing import Annotated, Optional
+from pydantic import Field, TypeAdapter
+from schema.pydantic_model import FrozenPatient, Patient
+
+
+class StoredPatient(FrozenPatient):
+    """One value of patients.json, the id is the key of the dict and older records do not repeat it"""
+    id: Annotated[Optional[str], Field(None, description="Patient id, same as the key in patients.json")]
+
+
+# body of POST /bulk/create: a JSON array of patients
+PATIENT_LIST = TypeAdapter(list[Patient])
+# patients.json: {patient_id: record}
+PATIENT_RECORDS = TypeAdapter(dict[str, StoredPatient])
+
+
+def validate_records_json(raw) -> dict:
+    """Validate a patients.json document, returns {patient_id: record dict} with recomputed bmi / verdict.
+
+    Raises pydantic.ValidationError naming the first bad patient ids and fields.
+    """
+    patients = PATIENT_RECORDS.validate_json(raw)
+    # exclude_none only drops the missing ids, every other field is required
+    return PATIENT_RECORDS.dump_python(patients, exclude_none=True)
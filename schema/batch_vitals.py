@@ -0,0 +1,45 @@
+"""Vectorized BMI and verdict for many patients at once, same results as Patient.compute_bmi / decide_verdict"""
+
+from bisect import bisect_right
+from schema.pydantic_model import VERDICT_THRESHOLDS, VERDICTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # classify_records falls back to the per-record Patient formulas
+
+
+def compute_bmi_batch(heights, weights):
+    """weight / height², rounded to 2 decimals like Patient.compute_bmi"""
+    heights = np.asarray(heights, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    return np.round(weights / (heights * heights), 2)
+
+
+def decide_verdict_batch(bmi):
+    """One np.digitize over the verdict thresholds instead of an if/elif chain per patient"""
+    return np.asarray(VERDICTS, dtype=object)[np.digitize(bmi, VERDICT_THRESHOLDS)]
+
+
+def classify_records(records: list) -> list:
+    """Fill "compute_bmi" and "decide_verdict" of every record dict in place, returns the same list.
+
+    Without numpy every record goes through the same formulas as
+    Patient.compute_bmi / decide_verdict one by one.
+    """
+    if not records:
+        return records
+    if np is None:
+        for record in records:
+            bmi = round(record["weight"] / (record["height"] * record["height"]), 2)
+            record["compute_bmi"] = bmi
+            record["decide_verdict"] = VERDICTS[bisect_right(VERDICT_THRESHOLDS, bmi)]
+        return records
+    heights = np.fromiter((record["height"] for record in records), dtype=np.float64, count=len(records))
+    weights = np.fromiter((record["weight"] for record in records), dtype=np.float64, count=len(records))
+    bmi = compute_bmi_batch(heights, weights)
+    verdicts = decide_verdict_batch(bmi)
+    for record, record_bmi, verdict in zip(records, bmi.tolist(), verdicts.tolist()):
+        record["compute_bmi"] = record_bmi
+        record["decide_verdict"] = verdict
+    return records
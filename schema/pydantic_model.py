@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+from bisect import bisect_right
+from functools import cached_property
 from typing import Annotated, Optional, Literal
 
 
@@ -13,6 +15,14 @@ from typing import Annotated, Optional, Literal
     #     "verdict": "Obese"
     # },
 
+# bmi < 18.5 Underweight, < 25 Normal weight, < 30 Overweight, baaki Obese
+VERDICT_THRESHOLDS = (18.5, 25, 30)
+VERDICTS = ("Underweight", "Normal weight", "Overweight", "Obese")
+# computed fields jo height / weight pe depend karte hain, inke change hone pe cache clear hota hai
+VITAL_FIELDS = ("height", "weight")
+CACHED_FIELDS = ("compute_bmi", "decide_verdict")
+
+
 class Patient(BaseModel):
     id: Annotated[str, Field(..., description="Enter patient id", examples=["P001", "P002"])]
     name: Annotated[str, Field(..., description="Enter Name of the patient", max_length=40)]
@@ -23,24 +33,44 @@ class Patient(BaseModel):
     weight: Annotated[float, Field(..., gt = 0, lt= 150, description="enter weight in kgs")]
 
 
+    # cached_property: pehli baar compute hoke instance pe save, har model_dump pe dobara nahi
     @computed_field
-    @property
+    @cached_property
     def compute_bmi(self) -> float:
         return round(self.weight / (self.height * self.height), 2)
 
 
     @computed_field
-    @property
+    @cached_property
     def decide_verdict(self) -> str:
-        if self.compute_bmi < 18.5:
-            return "Underweight"
-        elif self.compute_bmi < 25:
-            return "Normal weight"
-        elif self.compute_bmi < 30:
-            return "Overweight"
-        else:
-            return "Obese"
-        
+        # bmi ek hi baar padhte hain, thresholds: < 18.5, < 25, < 30, baaki Obese
+        return VERDICTS[bisect_right(VERDICT_THRESHOLDS, self.compute_bmi)]
+
+
+    def _clear_cached_vitals(self):
+        for name in CACHED_FIELDS:
+            self.__dict__.pop(name, None)
+
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in VITAL_FIELDS:
+            self._clear_cached_vitals()
+
+
+    def model_copy(self, *, update=None, deep=False):
+        # model_copy cache bhi copy kar deta hai, height / weight badle toh purana bmi nahi chahiye
+        copied = super().model_copy(update=update, deep=deep)
+        if update and any(name in update for name in VITAL_FIELDS):
+            copied._clear_cached_vitals()
+        return copied
+
+
+class FrozenPatient(Patient):
+    """Read-only Patient for read paths: no assignment, so the cached bmi / verdict never go stale"""
+    model_config = ConfigDict(frozen=True)
+
+
 
 class Patient_update(BaseModel):
     name: Annotated[Optional[str], Field(None, description="Enter Name of the patient", max_length=40)]
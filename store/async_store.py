@@ -0,0 +1,89 @@
+"""Async facade over a PatientRepository that runs every call on a dedicated, bounded I/O executor"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Optional
+from store.base import PatientRepository
+
+# threads doing store I/O (file writes, fsync, sqlite), separate from starlette's 40 slot threadpool
+PATIENT_IO_WORKERS = int(os.getenv("PATIENT_IO_WORKERS", "8"))
+# calls allowed in flight or waiting for a worker, beyond that callers wait on the event loop without a thread
+PATIENT_IO_QUEUE = int(os.getenv("PATIENT_IO_QUEUE", "256"))
+# seconds a call may wait for a queue slot before StoreBusy is raised
+PATIENT_IO_QUEUE_TIMEOUT = float(os.getenv("PATIENT_IO_QUEUE_TIMEOUT", "10"))
+
+
+class StoreBusy(Exception):
+    """The I/O queue stayed full for longer than the queue timeout"""
+
+
+class AsyncPatientRepository:
+    """Awaitable versions of the PatientRepository operations.
+
+    Each call is handed to a ThreadPoolExecutor owned by this object, so a slow
+    disk only ties up its `workers` threads and never the threadpool the
+    rest of the app relies on. At most `max_pending` calls are queued or
+    running; more callers wait for a slot as plain coroutines and get
+    StoreBusy after `queue_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        repository: PatientRepository,
+        workers: int = PATIENT_IO_WORKERS,
+        max_pending: int = PATIENT_IO_QUEUE,
+        queue_timeout: float = PATIENT_IO_QUEUE_TIMEOUT,
+    ):
+        self.repository = repository
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="patient-store-io")
+        self._slots = asyncio.Semaphore(self.max_pending)
+        await self.run(self.repository.start)
+
+    async def stop(self):
+        try:
+            await self.run(self.repository.stop)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """`function(*args, **kwargs)` on the I/O executor, for work that mixes store calls with encoding"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise StoreBusy(f"{self.max_pending} patient store calls already pending")
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(function, *args, **kwargs))
+        finally:
+            self._slots.release()
+
+    async def search(self, equals: dict, ranges: dict, limit: Optional[int] = None, offset: int = 0) -> list:
+        return await self.run(self.repository.search, equals, ranges, limit=limit, offset=offset)
+
+    async def iter_all(self, chunk_size: int = 500) -> AsyncIterator[list]:
+        """Async `PatientRepository.iter_all`, every keyset page is its own executor call"""
+        chunks = self.repository.iter_all(chunk_size)
+        while True:
+            chunk = await self.run(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def insert(self, patient_id: str, record: dict) -> bool:
+        return await self.run(self.repository.insert, patient_id, record)
+
+    async def update(self, patient_id: str, apply: Callable[[dict], dict], if_match: Optional[str] = None) -> dict:
+        return await self.run(self.repository.update, patient_id, apply, if_match=if_match)
+
+    async def delete(self, patient_id: str, if_match: Optional[str] = None):
+        return await self.run(self.repository.delete, patient_id, if_match=if_match)
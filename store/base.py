@@ -0,0 +1,217 @@
+"""Repository interface shared by every patient storage backend"""
+
+import base64
+import hashlib
+import heapq
+import json
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional
+
+# attributes /sort accepts, mapped to the key they are stored under in a record
+SORT_FIELDS = {"height": "height", "weight": "weight", "bmi": "compute_bmi"}
+# /patients/search filters: exact match fields and inclusive range fields
+SEARCH_EQUALITY_FIELDS = {"city": "city", "gender": "gender", "verdict": "decide_verdict"}
+SEARCH_RANGE_FIELDS = ("age", "bmi")
+
+
+class PreconditionFailed(Exception):
+    """If-Match did not match the current version of the record"""
+
+
+def record_etag(record: dict) -> str:
+    """Content based ETag, stable across restarts and uvicorn workers"""
+    digest = hashlib.blake2b(
+        json.dumps(record, sort_keys=True).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_match: Optional[str], record: dict) -> bool:
+    if if_match is None or if_match.strip() == "*":
+        return True
+    return record_etag(record) in {tag.strip() for tag in if_match.split(",")}
+
+
+def sort_value(record: dict, field: str) -> float:
+    # older records were saved with "bmi" before the computed field was renamed
+    if field == "bmi":
+        return record.get("compute_bmi", record.get("bmi", 0))
+    return record.get(field, 0)
+
+
+def search_value(record: dict, field: str):
+    if field in SEARCH_EQUALITY_FIELDS:
+        return record.get(SEARCH_EQUALITY_FIELDS[field], record.get(field))
+    return sort_value(record, field)
+
+
+def matches(record: dict, equals: dict, ranges: dict) -> bool:
+    """True if the record has every value of `equals` and is inside every (low, high) of `ranges`"""
+    for field, value in equals.items():
+        if search_value(record, field) != value:
+            return False
+    for field, (low, high) in ranges.items():
+        value = search_value(record, field)
+        if (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+def page_key(patient_id: str, record: dict, field: str) -> tuple:
+    """Total order used for pagination, ties on `field` are broken by patient id"""
+    if field == "id":
+        return (patient_id, patient_id)
+    return (sort_value(record, field), patient_id)
+
+
+def encode_cursor(field: str, key: tuple) -> str:
+    raw = json.dumps([field, *key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(field: str, cursor: str) -> tuple:
+    """Keyset position stored in a cursor, raises ValueError if it is invalid or for another field"""
+    try:
+        cursor_field, value, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_field != field:
+        raise ValueError(f"Cursor was issued for {cursor_field!r}, not {field!r}")
+    # the key is compared against index entries, a wrongly typed one must not reach them
+    expected = str if field == "id" else (int, float)
+    if not isinstance(patient_id, str) or not isinstance(value, expected) or isinstance(value, bool):
+        raise ValueError("Invalid cursor")
+    return (value, patient_id)
+
+
+class PatientRepository(ABC):
+    """Storage agnostic patient repository used by the endpoints in main.py.
+
+    Records are plain dicts in the same shape as patients.json, keyed by
+    patient id, so every backend can import and export that file.
+
+    `changes` is the backend's store.change_notify.ChangeCounter, bumped on
+    every write other processes can see, or None.
+    """
+
+    changes = None
+
+    def start(self):
+        """Open the backend, called once from the app lifespan"""
+
+    def stop(self):
+        """Flush and close the backend, called once on shutdown"""
+
+    @abstractmethod
+    def all(self) -> dict:
+        """Every patient as {patient_id: record}"""
+
+    @abstractmethod
+    def get(self, patient_id: str) -> Optional[dict]:
+        """The record of one patient or None"""
+
+    def page(
+        self,
+        field: str,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[tuple] = None,
+    ) -> list:
+        """`(patient_id, record)` pairs ordered by `page_key` on `field` ("id" or one of SORT_FIELDS).
+
+        `after` is a keyset position from `decode_cursor`, only rows strictly
+        past it are returned. This generic version scans `all()` and picks the
+        first `offset + limit` rows with a heap instead of sorting everything;
+        backends with their own order override it.
+        """
+        items = self.all().items()
+        key = lambda item: page_key(item[0], item[1], field)
+        if after is not None:
+            items = [item for item in items if (key(item) < after if descending else key(item) > after)]
+        if limit is None:
+            return sorted(items, key=key, reverse=descending)[offset:]
+        top_k = heapq.nlargest if descending else heapq.nsmallest
+        return top_k(offset + limit, items, key=key)[offset:]
+
+    def search(self, equals: dict, ranges: dict, limit: Optional[int] = None, offset: int = 0) -> list:
+        """`(patient_id, record)` pairs matching every filter, ordered by patient id.
+
+        `equals` maps SEARCH_EQUALITY_FIELDS to a value, `ranges` maps
+        SEARCH_RANGE_FIELDS to an inclusive (low, high) tuple where either bound
+        may be None. This generic version scans `all()`.
+        """
+        found = sorted(
+            ((patient_id, record) for patient_id, record in self.all().items() if matches(record, equals, ranges)),
+            key=lambda item: item[0],
+        )
+        return found[offset:] if limit is None else found[offset:offset + limit]
+
+    def columns(self) -> dict:
+        """Columnar NumPy snapshot of every patient for store.columnar.describe.
+
+        This generic version builds it from `all()` on every call, backends
+        that keep a live ColumnarIndex return a copy of it instead.
+        """
+        from store.columnar import ColumnarIndex
+
+        index = ColumnarIndex()
+        index.rebuild(self.all())
+        return index.snapshot()
+
+    def iter_all(self, chunk_size: int = 500) -> Iterator[list]:
+        """Every patient as chunks of `(patient_id, record)` pairs in id order.
+
+        Each chunk is its own keyset page, so no lock or database cursor is held
+        between chunks and at most `chunk_size` records are in flight.
+        """
+        after = None
+        while True:
+            chunk = self.page("id", descending=False, limit=chunk_size, after=after)
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            after = page_key(chunk[-1][0], chunk[-1][1], "id")
+
+    @abstractmethod
+    def insert(self, patient_id: str, record: dict) -> bool:
+        """Add a new patient, returns False if the id is already taken"""
+
+    @abstractmethod
+    def update(
+        self,
+        patient_id: str,
+        apply: Callable[[dict], dict],
+        if_match: Optional[str] = None,
+    ) -> dict:
+        """Replace a record with `apply(copy_of_current)` atomically.
+
+        Raises KeyError if the patient does not exist and PreconditionFailed if
+        `if_match` is given and does not match the current ETag.
+        """
+
+    @abstractmethod
+    def delete(self, patient_id: str, if_match: Optional[str] = None):
+        """Remove a patient, raises KeyError / PreconditionFailed like `update`"""
+
+    @abstractmethod
+    def insert_many(self, records: dict) -> list:
+        """Add every new patient of {patient_id: record} in a single write, returns the ids already taken"""
+
+    @abstractmethod
+    def update_many(self, applies: dict) -> dict:
+        """Run every {patient_id: apply} like `update` and persist the results in a single write.
+
+        Returns {patient_id: exception} for the patients that were not updated,
+        KeyError if missing or whatever `apply` raised.
+        """
+
+    @abstractmethod
+    def delete_many(self, patient_ids: list) -> list:
+        """Remove patients in a single write, returns the ids that did not exist"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
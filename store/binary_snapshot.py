@@ -0,0 +1,196 @@
+"""Compact binary patient snapshot that is read in place through a read-only mmap.
+
+Layout, all integers little endian:
+
+    header   magic, record count, index slots, table / index / pool offsets
+    table    one fixed-size RECORD per patient, sorted by id
+    index    open addressing hash table of uint32 slots, crc32(id) -> row + 1 (0 is empty)
+    pool     utf-8 strings, every distinct string stored once
+
+A RECORD holds height, weight and bmi as float64, (offset, length) pairs into
+the pool for id, name, city, gender and verdict, the age as int32 and a bitmask
+of the columns that are null. Records come out in the same canonical shape as
+the SQLite backend (`store.sqlite_store.row_to_record`).
+"""
+
+import mmap
+import struct
+import zlib
+from typing import Optional
+
+MAGIC = b"PATSNAP1"
+HEADER = struct.Struct("<8sIIQQQ")
+RECORD = struct.Struct("<ddd10IiI")
+SLOT = struct.Struct("<I")
+
+STRING_COLUMNS = ("id", "name", "city", "gender", "verdict")
+FLOAT_COLUMNS = ("height", "weight", "bmi")
+# bit of every nullable column in the null mask
+NULL_BITS = {column: 1 << bit for bit, column in enumerate(FLOAT_COLUMNS + STRING_COLUMNS[1:] + ("age",))}
+
+
+def _column_values(patient_id: str, record: dict) -> dict:
+    return {
+        "id": patient_id,
+        "name": record.get("name"),
+        "city": record.get("city"),
+        "gender": record.get("gender"),
+        "verdict": record.get("decide_verdict", record.get("verdict")),
+        "age": record.get("age"),
+        "height": record.get("height"),
+        "weight": record.get("weight"),
+        "bmi": record.get("compute_bmi", record.get("bmi")),
+    }
+
+
+def _slot_count(count: int) -> int:
+    # power of two at least twice the records, keeps linear probe chains short
+    slots = 1
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+def encode(data: dict) -> bytes:
+    """Binary snapshot of {patient_id: record}"""
+    ids = sorted(data)
+    count = len(ids)
+    slots = _slot_count(count)
+    table_offset = HEADER.size
+    index_offset = table_offset + count * RECORD.size
+    pool_offset = index_offset + slots * SLOT.size
+
+    pool = bytearray()
+    pooled = {}
+
+    def intern(value: str) -> tuple:
+        if value not in pooled:
+            raw = value.encode("utf-8")
+            pooled[value] = (len(pool), len(raw))
+            pool.extend(raw)
+        return pooled[value]
+
+    table = bytearray(count * RECORD.size)
+    index = [0] * slots
+    mask = slots - 1
+    for row, patient_id in enumerate(ids):
+        values = _column_values(patient_id, data[patient_id])
+        nulls = 0
+        strings = []
+        for column in STRING_COLUMNS:
+            value = values[column]
+            if value is None:
+                nulls |= NULL_BITS[column]
+                strings.extend((0, 0))
+            else:
+                strings.extend(intern(str(value)))
+        floats = []
+        for column in FLOAT_COLUMNS:
+            value = values[column]
+            if value is None:
+                nulls |= NULL_BITS[column]
+            floats.append(0.0 if value is None else float(value))
+        age = values["age"]
+        if age is None:
+            nulls |= NULL_BITS["age"]
+        RECORD.pack_into(table, row * RECORD.size, *floats, *strings, 0 if age is None else int(age), nulls)
+
+        slot = zlib.crc32(patient_id.encode("utf-8")) & mask
+        while index[slot]:
+            slot = (slot + 1) & mask
+        index[slot] = row + 1
+
+    header = HEADER.pack(MAGIC, count, slots, table_offset, index_offset, pool_offset)
+    return b"".join((header, bytes(table), struct.pack(f"<{slots}I", *index), bytes(pool)))
+
+
+class SnapshotReader:
+    """Read-only view of one binary snapshot file.
+
+    The file is mmapped, so every process reading the same snapshot shares
+    its pages through the page cache, and a lookup only unpacks the one
+    record it returns. A reader keeps showing the file it opened even after
+    a newer snapshot is renamed over the path.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.slots, self._table, self._index, self._pool = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a binary patient snapshot")
+        self._mask = self.slots - 1
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _string(self, offset: int, length: int) -> str:
+        return self._map[self._pool + offset:self._pool + offset + length].decode("utf-8")
+
+    def _id_bytes(self, row: int) -> bytes:
+        offset, length = struct.unpack_from("<II", self._map, self._table + row * RECORD.size + 24)
+        return self._map[self._pool + offset:self._pool + offset + length]
+
+    def id_at(self, row: int) -> str:
+        return self._id_bytes(row).decode("utf-8")
+
+    def record(self, row: int) -> dict:
+        height, weight, bmi, *strings, age, nulls = RECORD.unpack_from(self._map, self._table + row * RECORD.size)
+        values = {"height": height, "weight": weight, "bmi": bmi, "age": age}
+        for position, column in enumerate(STRING_COLUMNS):
+            values[column] = self._string(strings[2 * position], strings[2 * position + 1])
+        for column, bit in NULL_BITS.items():
+            if nulls & bit:
+                values[column] = None
+        return {
+            "id": values["id"],
+            "name": values["name"],
+            "city": values["city"],
+            "age": values["age"],
+            "gender": values["gender"],
+            "height": values["height"],
+            "weight": values["weight"],
+            "compute_bmi": values["bmi"],
+            "decide_verdict": values["verdict"],
+        }
+
+    def find(self, patient_id: str) -> Optional[int]:
+        """Row of `patient_id` through the hash index, None if it is not in the snapshot"""
+        if self.count == 0:
+            return None
+        key = patient_id.encode("utf-8")
+        slot = zlib.crc32(key) & self._mask
+        while True:
+            (entry,) = SLOT.unpack_from(self._map, self._index + slot * SLOT.size)
+            if entry == 0:
+                return None
+            if self._id_bytes(entry - 1) == key:
+                return entry - 1
+            slot = (slot + 1) & self._mask
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        row = self.find(patient_id)
+        return None if row is None else self.record(row)
+
+    def bisect(self, patient_id: str, right: bool = False) -> int:
+        """First row whose id is greater than (or with `right=False` not less than) `patient_id`.
+
+        Rows are sorted by id and utf-8 bytes sort like the str they encode.
+        """
+        key = patient_id.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            current = self._id_bytes(middle)
+            if current < key or (right and current == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def all(self) -> dict:
+        return {record["id"]: record for record in map(self.record, range(self.count))}
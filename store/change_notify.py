@@ -0,0 +1,107 @@
+"""Cross-process change counter in shared memory, tells every worker when another one wrote"""
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Callable, Optional
+
+COUNTER = struct.Struct("<Q")
+
+logger = logging.getLogger(__name__)
+
+
+def counter_path(path: str) -> str:
+    return f"{path}.changes"
+
+
+class ChangeCounter:
+    """An 8 byte counter in `<path>.changes`, mapped MAP_SHARED by every process using `path`.
+
+    Writers `bump()` it after each write other processes can see. Readers
+    `poll()` it, which is a plain memory read of the shared page, no syscall
+    and no file read, so it can run on every request. A change this process
+    did not make itself calls every `subscribe`d listener, in `poll()` or,
+    if another process wrote just before, in this process' own `bump()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = counter_path(path)
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._seen = 0
+        self._listeners: list = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._map is not None:
+            return
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < COUNTER.size:
+            os.ftruncate(self._fd, COUNTER.size)
+        self._map = mmap.mmap(self._fd, COUNTER.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._seen = self.value
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map, self._fd = None, None
+
+    @property
+    def value(self) -> int:
+        return COUNTER.unpack_from(self._map, 0)[0]
+
+    def subscribe(self, listener: Callable[[], None]):
+        """Call `listener()` whenever another process changed the data"""
+        self._listeners.append(listener)
+
+    def _notify(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Change listener of {self.path} failed: {e}")
+
+    def poll(self) -> bool:
+        """True (and listeners notified) if another process wrote since the last poll / bump"""
+        if self._map is None or self.value == self._seen:
+            return False
+        with self._lock:
+            current = self.value
+            if current == self._seen:
+                return False
+            self._seen = current
+        self._notify()
+        return True
+
+    def bump(self) -> int:
+        """Count one write of this process, returns the new value"""
+        if self._map is None:
+            self.open()
+        # the flock only serialises concurrent bumps, readers never take it
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            with self._lock:
+                previous = self.value
+                foreign = previous != self._seen
+                current = previous + 1
+                COUNTER.pack_into(self._map, 0, current)
+                self._seen = current
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        if foreign:
+            self._notify()
+        return current
+
+
+def notify_change(path: str):
+    """One-off bump for tools that write `path` without keeping a counter open (e.g. store.migrate)"""
+    counter = ChangeCounter(path)
+    counter.open()
+    try:
+        counter.bump()
+    finally:
+        counter.close()
@@ -0,0 +1,67 @@
+"""JSON codec shared by the API responses and the patient storage files.
+
+orjson or msgspec when installed, the stdlib json module otherwise. All of
+them read and write the same documents, so patients.json and its log can be
+written by one codec and read by another.
+"""
+
+import json
+import logging
+import os
+
+# PATIENT_JSON_CODEC=orjson|msgspec|json forces one codec, "auto" picks the fastest one installed
+CODEC = os.getenv("PATIENT_JSON_CODEC", "auto")
+
+logger = logging.getLogger(__name__)
+
+
+def _orjson():
+    import orjson
+
+    # numpy scalars / arrays as plain numbers, like the stdlib codec would after .tolist()
+    option = orjson.OPT_SERIALIZE_NUMPY
+    return "orjson", lambda obj: orjson.dumps(obj, option=option), orjson.loads, orjson.JSONDecodeError
+
+
+def _msgspec():
+    import msgspec
+
+    return "msgspec", msgspec.json.Encoder().encode, msgspec.json.Decoder().decode, msgspec.DecodeError
+
+
+def _stdlib():
+    # same output as starlette's JSONResponse: compact, utf-8, no NaN
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    # ValueError also covers a torn utf-8 sequence at the end of a log
+    return "json", dumps, json.loads, ValueError
+
+
+CODECS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def _select(name: str) -> tuple:
+    if name != "auto" and name not in CODECS:
+        raise ValueError(f"Unknown PATIENT_JSON_CODEC {name!r}, choose from {sorted(CODECS)}")
+    candidates = ("orjson", "msgspec", "json") if name == "auto" else (name, "json")
+    for candidate in candidates:
+        try:
+            return CODECS[candidate]()
+        except ImportError:
+            if candidate == name:
+                logger.warning(f"PATIENT_JSON_CODEC={name} is not installed, falling back to stdlib json")
+
+
+# dumps(obj) -> bytes, loads(bytes | str) -> obj, DecodeError is raised by loads on invalid input
+NAME, dumps, loads, DecodeError = _select(CODEC)
+
+
+def dump(obj, f):
+    """Write `obj` to a file opened in binary mode"""
+    f.write(dumps(obj))
+
+
+def load(f):
+    """Read a document from a file opened in binary mode"""
+    return loads(f.read())
@@ -0,0 +1,174 @@
+"""Columnar NumPy copy of the patient store for vectorized analytics"""
+
+import logging
+from typing import Optional
+from store.base import search_value, sort_value
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # analytics are unavailable without numpy, the store works as before
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_COLUMNS = ("height", "weight", "bmi")
+CATEGORY_COLUMNS = ("city", "gender", "verdict")
+PERCENTILES = (25, 50, 75, 90, 99)
+
+
+def numeric_value(record: dict, column: str) -> float:
+    value = sort_value(record, column) if column == "bmi" else record.get(column)
+    return float("nan") if value is None else float(value)
+
+
+class ColumnarIndex:
+    """One float64 array per vital (height, weight, bmi) and one int32 code array per category.
+
+    Rows are kept dense: an add appends (doubling the capacity when full) and
+    a remove moves the last row into the hole, so both are O(1) and every
+    column is always a contiguous `[:size]` slice ready for NumPy.
+    Categories are dictionary encoded, `labels[column][code]` is the value.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise RuntimeError("numpy is required for the columnar patient index")
+        self._capacity = capacity
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self._ids: list = []
+        self._rows: dict = {}
+        self._numeric = {column: np.empty(self._capacity, dtype=np.float64) for column in NUMERIC_COLUMNS}
+        self._codes = {column: np.empty(self._capacity, dtype=np.int32) for column in CATEGORY_COLUMNS}
+        self.labels = {column: [] for column in CATEGORY_COLUMNS}
+        self._label_codes = {column: {} for column in CATEGORY_COLUMNS}
+
+    def _code(self, column: str, label) -> int:
+        codes = self._label_codes[column]
+        if label not in codes:
+            codes[label] = len(self.labels[column])
+            self.labels[column].append(label)
+        return codes[label]
+
+    def _grow(self, needed: int):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        for arrays in (self._numeric, self._codes):
+            for column, array in arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                arrays[column] = grown
+        self._capacity = capacity
+
+    def rebuild(self, data: dict):
+        self._capacity = max(1024, len(data))
+        self._reset()
+        records = list(data.values())
+        for column in NUMERIC_COLUMNS:
+            self._numeric[column][: len(records)] = np.fromiter(
+                (numeric_value(record, column) for record in records), dtype=np.float64, count=len(records)
+            )
+        for column in CATEGORY_COLUMNS:
+            self._codes[column][: len(records)] = np.fromiter(
+                (self._code(column, search_value(record, column)) for record in records), dtype=np.int32, count=len(records)
+            )
+        self._ids = list(data)
+        self._rows = {patient_id: row for row, patient_id in enumerate(self._ids)}
+        self.size = len(records)
+
+    def add(self, patient_id: str, record: dict):
+        self._grow(self.size + 1)
+        row = self.size
+        for column in NUMERIC_COLUMNS:
+            self._numeric[column][row] = numeric_value(record, column)
+        for column in CATEGORY_COLUMNS:
+            self._codes[column][row] = self._code(column, search_value(record, column))
+        self._ids.append(patient_id)
+        self._rows[patient_id] = row
+        self.size += 1
+
+    def remove(self, patient_id: str, record: dict):
+        row = self._rows.pop(patient_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for arrays in (self._numeric, self._codes):
+                for array in arrays.values():
+                    array[row] = array[last]
+            moved_id = self._ids[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self.size = last
+
+    def snapshot(self) -> dict:
+        """Copies of the live columns, safe to aggregate after the store lock is released"""
+        columns = {column: array[: self.size].copy() for column, array in self._numeric.items()}
+        columns.update({column: array[: self.size].copy() for column, array in self._codes.items()})
+        columns["labels"] = {column: list(labels) for column, labels in self.labels.items()}
+        return columns
+
+
+def _describe_values(values, edges) -> dict:
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"count": 0}
+    percentiles = np.percentile(values, PERCENTILES)
+    counts, _ = np.histogram(values, bins=edges)
+    summary = {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+    summary.update({f"p{p}": float(v) for p, v in zip(PERCENTILES, percentiles)})
+    summary["histogram"] = {"edges": edges.tolist(), "counts": counts.tolist()}
+    return summary
+
+
+def describe(columns: dict, group_by: Optional[str] = None, bins: int = 10) -> dict:
+    """Population statistics over a `ColumnarIndex.snapshot()`.
+
+    Mean, std, min, max, percentiles and a histogram per vital, plus the
+    verdict distribution, for everyone or for every value of `group_by`
+    ("city" or "gender"). Histogram edges are shared by all groups so the
+    counts are comparable.
+    """
+    total = columns["bmi"].size
+    verdict_labels = columns["labels"]["verdict"]
+    edges = {}
+    for column in NUMERIC_COLUMNS:
+        values = columns[column][~np.isnan(columns[column])]
+        low, high = (float(values.min()), float(values.max())) if values.size else (0.0, 1.0)
+        edges[column] = np.histogram_bin_edges(values, bins=bins, range=(low, high))
+
+    if group_by is None:
+        # a plain slice, fancy indexing would copy every column once more
+        groups = {"all": slice(None)}
+    else:
+        # one stable sort by group code, then every group is a contiguous slice
+        codes = columns[group_by]
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        groups = {
+            str(columns["labels"][group_by][codes[rows[0]]]): rows
+            for rows in np.split(order, boundaries)
+            if rows.size
+        }
+
+    result = {}
+    for name, rows in groups.items():
+        verdict_counts = np.bincount(columns["verdict"][rows], minlength=len(verdict_labels))
+        result[name] = {
+            "count": int(verdict_counts.sum()),
+            "vitals": {column: _describe_values(columns[column][rows], edges[column]) for column in NUMERIC_COLUMNS},
+            "verdicts": {str(label): int(count) for label, count in zip(verdict_labels, verdict_counts) if count},
+        }
+    return {"count": int(total), "group_by": group_by, "groups": result}
@@ -0,0 +1,34 @@
+"""Equality index kept in sync with the in-memory patient store"""
+
+from store.base import search_value
+
+
+class HashIndex:
+    """Patient ids grouped by the exact value of one field, e.g. every id per city."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self._buckets: dict = {}
+
+    def rebuild(self, data: dict):
+        self._buckets = {}
+        for patient_id, record in data.items():
+            self.add(patient_id, record)
+
+    def add(self, patient_id: str, record: dict):
+        self._buckets.setdefault(search_value(record, self.field), set()).add(patient_id)
+
+    def remove(self, patient_id: str, record: dict):
+        value = search_value(record, self.field)
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            return
+        bucket.discard(patient_id)
+        if not bucket:
+            del self._buckets[value]
+
+    def ids(self, value) -> set:
+        return self._buckets.get(value, set())
+
+    def count(self, value) -> int:
+        return len(self._buckets.get(value, ()))
@@ -0,0 +1,111 @@
+"""Move patients between the json file and the SQLite database, or reclassify them.
+
+    python -m store.migrate import patients.json patients.db      (or patients.snap)
+    python -m store.migrate export patients.db patients.json      (or patients.snap)
+    python -m store.migrate recompute patients.json      (or patients.db, patients.snap)
+"""
+
+import argparse
+from pydantic import ValidationError
+from schema.batch_vitals import classify_records
+from store.binary_snapshot import SnapshotReader, encode
+from store.patient_store import load_all
+from store.snapshot import publish, write_snapshot, writer_lock
+from store.sqlite_store import SqlitePatientRepository
+
+
+def read_binary_snapshot(snapshot_path: str) -> dict:
+    reader = SnapshotReader(snapshot_path)
+    try:
+        return reader.all()
+    finally:
+        reader.close()
+
+
+def write_binary_snapshot(data: dict, snapshot_path: str):
+    with writer_lock(snapshot_path):
+        publish(snapshot_path, lambda f: f.write(encode(data)))
+
+
+def import_json(json_path: str, db_path: str) -> int:
+    # invalid patients are rejected before anything is written to the database
+    data = load_all(json_path, validate=True)
+    if db_path.endswith(".snap"):
+        write_binary_snapshot(data, db_path)
+        return len(data)
+    repository = SqlitePatientRepository(db_path)
+    repository.start()
+    try:
+        repository.put_many(data.items())
+    finally:
+        repository.stop()
+    return len(data)
+
+
+def export_json(db_path: str, json_path: str) -> int:
+    if db_path.endswith(".snap"):
+        data = read_binary_snapshot(db_path)
+        write_snapshot(data, json_path)
+        return len(data)
+
+    repository = SqlitePatientRepository(db_path)
+    repository.start()
+    try:
+        data = repository.all()
+    finally:
+        repository.stop()
+    write_snapshot(data, json_path)
+    return len(data)
+
+
+def recompute(path: str) -> int:
+    """Recompute compute_bmi / decide_verdict of every patient from height and weight, in one vectorized pass"""
+    if path.endswith(".json"):
+        data = load_all(path)
+        classify_records(list(data.values()))
+        write_snapshot(data, path)
+        return len(data)
+    if path.endswith(".snap"):
+        # read and rewrite under one writer lock, so no write of a running mmap backend is lost in between
+        with writer_lock(path):
+            data = read_binary_snapshot(path)
+            classify_records(list(data.values()))
+            publish(path, lambda f: f.write(encode(data)))
+        return len(data)
+
+    repository = SqlitePatientRepository(path)
+    repository.start()
+    try:
+        data = repository.all()
+        classify_records(list(data.values()))
+        repository.put_many(data.items())
+    finally:
+        repository.stop()
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move patients between patients.json and SQLite, or reclassify them")
+    parser.add_argument("command", choices=["import", "export", "recompute"])
+    parser.add_argument("source")
+    parser.add_argument("target", nargs="?")
+    args = parser.parse_args()
+
+    if args.command == "recompute":
+        print(f"recomputed bmi and verdict of {recompute(args.source)} patients in {args.source}")
+        return
+    if args.target is None:
+        parser.error(f"{args.command} needs a target")
+
+    if args.command == "import":
+        try:
+            count = import_json(args.source, args.target)
+        except ValidationError as e:
+            raise SystemExit(f"{args.source} has invalid patients, nothing was imported\n{e}")
+    else:
+        count = export_json(args.source, args.target)
+    print(f"{args.command}ed {count} patients from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Patient repository served from a memory-mapped binary snapshot shared by every uvicorn worker"""
+
+import logging
+import os
+import threading
+from typing import Callable, Optional
+from store.base import PatientRepository, PreconditionFailed, etag_matches
+from store.binary_snapshot import SnapshotReader, encode
+from store.change_notify import ChangeCounter
+from store.patient_store import PATIENTS_FILE, load_all
+from store.snapshot import publish, writer_lock
+
+PATIENTS_SNAPSHOT = os.getenv("PATIENTS_SNAPSHOT", "patients.snap")
+
+logger = logging.getLogger(__name__)
+
+
+class MmapPatientRepository(PatientRepository):
+    """Read-mostly repository for deployments with several uvicorn workers.
+
+    Nothing is parsed into the process: every worker mmaps the same binary
+    snapshot read-only, lookups by id go through its hash index and only the
+    requested record is decoded, and the pages are shared by all workers
+    through the page cache. /view pages by id are a binary search over the
+    id-sorted record table; other orders use the generic PatientRepository
+    scans.
+
+    A write takes the cross-process writer lock, rewrites the whole snapshot
+    with the change and bumps its shared memory ChangeCounter; readers poll
+    that counter (a memory read, no syscall) and map the new file. Writes therefore cost O(patients), so
+    batch them through the bulk endpoints.
+
+    On first start a missing snapshot is built once from `json_path`.
+    """
+
+    def __init__(self, path: str = PATIENTS_SNAPSHOT, json_path: str = PATIENTS_FILE):
+        self.path = path
+        self.json_path = json_path
+        self.generation = 0
+        self.changes = ChangeCounter(path)
+        self.changes.subscribe(self._mark_stale)
+        self._stale = True
+        self._reader: Optional[SnapshotReader] = None
+        self._lock = threading.RLock()
+
+    def start(self):
+        self.changes.open()
+        with writer_lock(self.path):
+            if not os.path.exists(self.path):
+                data = load_all(self.json_path)
+                publish(self.path, lambda f: f.write(encode(data)), self.changes)
+                logger.info(f"Built {self.path} from {self.json_path} with {len(data)} patients")
+        logger.info(f"Mapped {self.path} with {len(self._current())} patients")
+
+    def stop(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            self._stale = True
+        self.changes.close()
+
+    def _mark_stale(self):
+        self._stale = True
+
+    def _current(self) -> SnapshotReader:
+        """Reader of the newest snapshot, remapped when another process published a new one"""
+        self.changes.poll()
+        reader = self._reader
+        if reader is not None and not self._stale:
+            return reader
+        with self._lock:
+            if self._reader is None or self._stale:
+                # cleared first: a snapshot published while mapping marks it stale again
+                self._stale = False
+                # the old map is not closed here, requests still reading it keep a valid view
+                self._reader = SnapshotReader(self.path)
+            return self._reader
+
+    # ---------------- reads ----------------
+
+    def all(self) -> dict:
+        return self._current().all()
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        return self._current().get(patient_id)
+
+    def page(
+        self,
+        field: str,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[tuple] = None,
+    ) -> list:
+        if field != "id":
+            return super().page(field, descending, limit=limit, offset=offset, after=after)
+        reader = self._current()
+        after_id = None if after is None else after[1]
+        if descending:
+            end = reader.count if after_id is None else reader.bisect(after_id)
+            rows = range(end - 1 - offset, -1, -1)
+        else:
+            start = 0 if after_id is None else reader.bisect(after_id, right=True)
+            rows = range(start + offset, reader.count)
+        if limit is not None:
+            rows = rows[:limit]
+        return [(reader.id_at(row), reader.record(row)) for row in rows]
+
+    def __len__(self) -> int:
+        return len(self._current())
+
+    # ---------------- writes ----------------
+
+    def _write(self, change: Callable[[dict], bool]) -> SnapshotReader:
+        """Run `change(data)` on every record and publish the result if it returns True.
+
+        Returns the reader of the snapshot this write left behind.
+        """
+        with self._lock, writer_lock(self.path):
+            data = self._current().all()
+            if change(data):
+                self.generation = publish(self.path, lambda f: f.write(encode(data)), self.changes)
+                self._reader = SnapshotReader(self.path)
+            return self._reader
+
+    def insert(self, patient_id: str, record: dict) -> bool:
+        return not self.insert_many({patient_id: record})
+
+    def insert_many(self, records: dict) -> list:
+        taken = []
+
+        def change(data):
+            taken.extend(patient_id for patient_id in records if patient_id in data)
+            data.update((patient_id, record) for patient_id, record in records.items() if patient_id not in data)
+            return len(taken) < len(records)
+
+        self._write(change)
+        return taken
+
+    def update(
+        self,
+        patient_id: str,
+        apply: Callable[[dict], dict],
+        if_match: Optional[str] = None,
+    ) -> dict:
+        def change(data):
+            current = data.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            data[patient_id] = apply(dict(current))
+            return True
+
+        # the stored shape, so the caller's ETag matches the one GET returns
+        return self._write(change).get(patient_id)
+
+    def update_many(self, applies: dict) -> dict:
+        failed = {}
+
+        def change(data):
+            for patient_id, apply in applies.items():
+                current = data.get(patient_id)
+                if current is None:
+                    failed[patient_id] = KeyError(patient_id)
+                    continue
+                try:
+                    data[patient_id] = apply(dict(current))
+                except Exception as e:
+                    failed[patient_id] = e
+            return len(failed) < len(applies)
+
+        self._write(change)
+        return failed
+
+    def delete(self, patient_id: str, if_match: Optional[str] = None):
+        def change(data):
+            current = data.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            del data[patient_id]
+            return True
+
+        self._write(change)
+
+    def delete_many(self, patient_ids: list) -> list:
+        missing = []
+
+        def change(data):
+            missing.extend(patient_id for patient_id in patient_ids if patient_id not in data)
+            for patient_id in patient_ids:
+                data.pop(patient_id, None)
+            return len(missing) < len(patient_ids)
+
+        self._write(change)
+        return missing
@@ -0,0 +1,458 @@
+"""In-memory patient store with write-behind or write-ahead-log persistence to patients.json"""
+
+import logging
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Optional
+from schema.adapters import validate_records_json
+from store.base import (
+    SEARCH_EQUALITY_FIELDS,
+    SEARCH_RANGE_FIELDS,
+    SORT_FIELDS,
+    PatientRepository,
+    PreconditionFailed,
+    etag_matches,
+    matches,
+)
+from store import codec, columnar
+from store.change_notify import ChangeCounter
+from store.hash_index import HashIndex
+from store.snapshot import publish, read_generation, write_snapshot, writer_lock
+from store.sorted_index import SortedIndex
+from store.wal import WriteAheadLog
+
+PATIENTS_FILE = os.getenv("PATIENTS_FILE", "patients.json")
+# "snapshot": write-behind dump of the whole file, "wal": append one line per mutation
+STORAGE_MODE = os.getenv("PATIENT_STORAGE_MODE", "snapshot")
+# seconds between two flushes of the write-behind task, 0 means write-through
+FLUSH_INTERVAL = float(os.getenv("PATIENT_FLUSH_INTERVAL", "1.0"))
+# wal mode: seconds between two compactions and log size that triggers one early
+COMPACT_INTERVAL = float(os.getenv("PATIENT_COMPACT_INTERVAL", "30"))
+WAL_MAX_ENTRIES = int(os.getenv("PATIENT_WAL_MAX_ENTRIES", "1000"))
+WAL_FSYNC = os.getenv("PATIENT_WAL_FSYNC", "0") == "1"
+# several uvicorn workers share the file: reload when another worker wrote a new generation
+SHARED_SNAPSHOT = os.getenv("PATIENT_SHARED_SNAPSHOT", "0") == "1"
+# number of striped per-record locks, two ids only contend when they hash to the same stripe
+RECORD_LOCK_STRIPES = 64
+
+logger = logging.getLogger(__name__)
+
+
+def load_all(path: str = PATIENTS_FILE, validate: bool = False) -> dict:
+    """Records of the json file at `path`, {} if it does not exist.
+
+    With `validate=True` the whole file goes through one `validate_json` call
+    of schema.adapters, raising ValidationError on a bad record and returning
+    every record with its bmi / verdict recomputed.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        if validate:
+            return validate_records_json(f.read())
+        data = codec.load(f)
+    return data
+
+
+def save_all(data: dict, path: str = PATIENTS_FILE, changes: Optional[ChangeCounter] = None) -> int:
+    return write_snapshot(data, path, changes)
+
+
+class PatientStore(PatientRepository):
+    """Process wide patient repository backed by patients.json.
+
+    The json file is parsed once on `start()` and reads are served from memory.
+
+    In "snapshot" mode mutations only mark the store dirty. A background thread
+    flushes the whole dict every `flush_interval` seconds, so many writes in one
+    interval cost a single file write.
+
+    In "wal" mode every mutation appends one line to `<path>.wal` before it is
+    visible, so a write costs the same no matter how many patients exist. The
+    background thread compacts the log into the json snapshot every
+    `compact_interval` seconds, or earlier once it holds `wal_max_entries`.
+    Startup replays the snapshot plus whatever log is left.
+
+    `stop()` forces a final flush / compaction.
+
+    Snapshots are written atomically and carry a generation counter. Every
+    snapshot also bumps the shared memory ChangeCounter of the file. With
+    `shared=True` reads poll that counter, a plain memory read, and reload
+    only after another worker published a newer snapshot. Every write then
+    holds the cross-process `writer_lock`, reloads first if another worker
+    published since, and writes the snapshot through before the lock is
+    released, so no worker overwrites a write it has not seen. Shared mode
+    needs "snapshot" mode: one log appended and rotated by several processes
+    would lose writes.
+
+    `insert`, `update` and `delete` are read-modify-write safe: they hold a
+    striped per-record lock for the whole operation, and the store wide lock
+    only for the dict/log mutation itself, so validation of different patients
+    runs in parallel on the threadpool.
+
+    Secondary indexes (one SortedIndex per /sort and search range attribute
+    plus one on the id for /view pages, one HashIndex per search equality
+    attribute, and a ColumnarIndex for analytics when numpy is installed) are
+    rebuilt on load and updated incrementally by every mutation, under the
+    store wide lock.
+    """
+
+    def __init__(
+        self,
+        path: str = PATIENTS_FILE,
+        flush_interval: float = FLUSH_INTERVAL,
+        mode: str = STORAGE_MODE,
+        compact_interval: float = COMPACT_INTERVAL,
+        wal_max_entries: int = WAL_MAX_ENTRIES,
+        shared: bool = SHARED_SNAPSHOT,
+    ):
+        if mode not in ("snapshot", "wal"):
+            raise ValueError(f"Unknown patient storage mode {mode!r}")
+        if shared and mode == "wal":
+            raise ValueError("PATIENT_SHARED_SNAPSHOT needs snapshot mode, the write-ahead log is per process")
+        self.path = path
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.wal_max_entries = wal_max_entries
+        self.shared = shared
+        self.generation = 0
+        self.changes = ChangeCounter(path)
+        self.changes.subscribe(self._mark_stale)
+        self._stale = False
+        self.wal = WriteAheadLog(f"{path}.wal", fsync=WAL_FSYNC) if mode == "wal" else None
+        self._data: dict = {}
+        self._sorted_indexes = {
+            field: SortedIndex(field) for field in dict.fromkeys(("id", *SORT_FIELDS, *SEARCH_RANGE_FIELDS))
+        }
+        self._hash_indexes = {field: HashIndex(field) for field in SEARCH_EQUALITY_FIELDS}
+        self._columnar = columnar.ColumnarIndex() if columnar.np is not None else None
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._record_locks = [threading.Lock() for _ in range(RECORD_LOCK_STRIPES)]
+        self._dirty = False
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._flusher = None
+
+    def _load(self):
+        # generation first: a write racing with the load only causes one extra reload
+        self.generation = read_generation(self.path)
+        self._data = load_all(self.path)
+        self._rebuild_indexes()
+
+    def _indexes(self) -> list:
+        indexes = [*self._sorted_indexes.values(), *self._hash_indexes.values()]
+        if self._columnar is not None:
+            indexes.append(self._columnar)
+        return indexes
+
+    def _rebuild_indexes(self):
+        for index in self._indexes():
+            index.rebuild(self._data)
+
+    def _index_put(self, patient_id: str, old: Optional[dict], new: dict):
+        for index in self._indexes():
+            if old is not None:
+                index.remove(patient_id, old)
+            index.add(patient_id, new)
+
+    def _index_delete(self, patient_id: str, old: dict):
+        for index in self._indexes():
+            index.remove(patient_id, old)
+
+    def start(self):
+        self.changes.open()
+        with self._lock:
+            self._load()
+            self._dirty = False
+            if self.wal is not None:
+                self._replay_wal()
+                self._rebuild_indexes()
+        logger.info(f"Loaded {len(self._data)} patients from {self.path}")
+
+        interval = self.compact_interval if self.wal is not None else self.flush_interval
+        if interval > 0 and self._flusher is None:
+            self._stop_event.clear()
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(interval,), name="patient-store-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _replay_wal(self):
+        # a compaction may have crashed after rotating, the old log goes first
+        rotated = self.wal.rotated_path
+        replayed = WriteAheadLog.replay(rotated, self._data)
+        replayed += WriteAheadLog.replay(self.wal.path, self._data)
+        if replayed:
+            logger.info(f"Replayed {replayed} write-ahead log entries")
+            # fold the leftovers right away so both logs start empty
+            self.generation = save_all(self._data, self.path, self.changes)
+            for log_path in (rotated, self.wal.path):
+                if os.path.exists(log_path):
+                    os.remove(log_path)
+        self.wal.open()
+
+    def stop(self):
+        if self._flusher is not None:
+            self._stop_event.set()
+            self._wake_event.set()
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        if self.wal is not None:
+            self.wal.close()
+        self.changes.close()
+
+    def _flush_loop(self, interval: float):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Background flush of {self.path} failed: {e}")
+
+    def flush(self):
+        """Write the current contents to disk if anything changed since the last flush."""
+        if self.wal is not None:
+            return self.compact()
+        with self._lock:
+            if not self._dirty:
+                return
+            # records are replaced and never mutated in place, a shallow copy is a consistent snapshot
+            snapshot = dict(self._data)
+            self._dirty = False
+        try:
+            generation = save_all(snapshot, self.path, self.changes)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+        self.generation = generation
+
+    def _mark_stale(self):
+        self._stale = True
+
+    def refresh(self):
+        """Reload from disk if another process published a newer snapshot.
+
+        Shared stores write through, so nothing of this process is ever
+        pending and the reload cannot drop a local write.
+        """
+        self.changes.poll()
+        if not self._stale:
+            return
+        with self._lock:
+            # cleared first: a snapshot published during the load bumps the counter and marks it again
+            self._stale = False
+            self._load()
+            logger.info(f"Reloaded {self.path} at generation {self.generation}")
+
+    @contextmanager
+    def _write_section(self):
+        """Cross-process critical section of one write, only shared stores need one.
+
+        Holds `writer_lock` from the read of the current records to the
+        write-through in `_mark_dirty`, and applies the write on top of the
+        newest snapshot on disk.
+        """
+        if not self.shared:
+            yield
+            return
+        with writer_lock(self.path):
+            self.changes.poll()
+            with self._lock:
+                if self._stale or read_generation(self.path) != self.generation:
+                    self._stale = False
+                    self._load()
+            yield
+
+    def compact(self):
+        """Fold the write-ahead log into the json snapshot."""
+        # one compaction at a time: a second one would append to the rotated log this one removes
+        with self._compact_lock:
+            with self._lock:
+                # a rotated log left by a failed compaction still has to reach the snapshot
+                if self.wal.entries == 0 and not os.path.exists(self.wal.rotated_path):
+                    return
+                snapshot = dict(self._data)
+                # new mutations go to a fresh log while the snapshot is written
+                rotated = self.wal.rotate()
+            self.generation = save_all(snapshot, self.path, self.changes)
+            os.remove(rotated)
+
+    def _apply(self, mutations: list):
+        """Apply `(op, patient_id, record)` mutations as one write, caller holds the store lock"""
+        if not mutations:
+            return
+        if self.wal is not None:
+            # logged before they become visible
+            self.wal.append_many(mutations)
+            if self.wal.entries >= self.wal_max_entries:
+                self._wake_event.set()
+        for op, patient_id, record in mutations:
+            old = self._data.get(patient_id)
+            if op == "put":
+                self._index_put(patient_id, old, record)
+                self._data[patient_id] = record
+            else:
+                self._index_delete(patient_id, old)
+                del self._data[patient_id]
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        if self.wal is not None:
+            return
+        if self.shared:
+            # inside _write_section, write_snapshot would take the writer lock a second time
+            snapshot = dict(self._data)
+            self.generation = publish(self.path, lambda f: codec.dump(snapshot, f), self.changes)
+            return
+        self._dirty = True
+        if self.flush_interval <= 0:
+            self.flush()
+
+    # ---------------- reads ----------------
+
+    def all(self) -> dict:
+        if self.shared:
+            self.refresh()
+        with self._lock:
+            return dict(self._data)
+
+    def get(self, patient_id: str):
+        if self.shared:
+            self.refresh()
+        return self._data.get(patient_id)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def page(
+        self,
+        field: str,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[tuple] = None,
+    ) -> list:
+        if self.shared:
+            self.refresh()
+        # the index is already in order, only the walk is left, top-K costs O(K)
+        with self._lock:
+            ids = self._sorted_indexes[field].ids(descending, after=after, offset=offset, limit=limit)
+            return [(patient_id, self._data[patient_id]) for patient_id in ids]
+
+    def columns(self) -> dict:
+        if self._columnar is None:
+            return super().columns()
+        if self.shared:
+            self.refresh()
+        with self._lock:
+            return self._columnar.snapshot()
+
+    def _plan(self, equals: dict, ranges: dict):
+        """Candidate ids from the most selective index, every index costs O(1) or O(log n) to size"""
+        options = [(self._hash_indexes[field].count(value), "hash", field) for field, value in equals.items()]
+        options += [(self._sorted_indexes[field].count_between(*bounds), "range", field) for field, bounds in ranges.items()]
+        if not options:
+            return self._sorted_indexes["id"].ids()
+        _, kind, field = min(options)
+        if kind == "hash":
+            return self._hash_indexes[field].ids(equals[field])
+        return self._sorted_indexes[field].ids_between(*ranges[field])
+
+    def search(self, equals: dict, ranges: dict, limit: Optional[int] = None, offset: int = 0) -> list:
+        if self.shared:
+            self.refresh()
+        with self._lock:
+            found = [
+                (patient_id, self._data[patient_id])
+                for patient_id in self._plan(equals, ranges)
+                if matches(self._data[patient_id], equals, ranges)
+            ]
+        found.sort(key=lambda item: item[0])
+        return found[offset:] if limit is None else found[offset:offset + limit]
+
+    # ---------------- writes ----------------
+
+    def _record_lock(self, patient_id: str) -> threading.Lock:
+        return self._record_locks[hash(patient_id) % RECORD_LOCK_STRIPES]
+
+    @contextmanager
+    def _record_locks_for(self, patient_ids):
+        # stripes in ascending order so two batches can never deadlock each other
+        stripes = sorted({hash(patient_id) % RECORD_LOCK_STRIPES for patient_id in patient_ids})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._record_locks[stripe])
+            yield
+
+    def insert(self, patient_id: str, record: dict) -> bool:
+        with self._record_lock(patient_id), self._write_section():
+            if patient_id in self._data:
+                return False
+            with self._lock:
+                self._apply([("put", patient_id, record)])
+            return True
+
+    def update(
+        self,
+        patient_id: str,
+        apply: Callable[[dict], dict],
+        if_match: Optional[str] = None,
+    ) -> dict:
+        with self._record_lock(patient_id), self._write_section():
+            current = self._data.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            record = apply(dict(current))
+            with self._lock:
+                self._apply([("put", patient_id, record)])
+            return record
+
+    def delete(self, patient_id: str, if_match: Optional[str] = None):
+        with self._record_lock(patient_id), self._write_section():
+            current = self._data.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            with self._lock:
+                self._apply([("del", patient_id, None)])
+
+    def insert_many(self, records: dict) -> list:
+        with self._record_locks_for(records), self._write_section():
+            taken = [patient_id for patient_id in records if patient_id in self._data]
+            with self._lock:
+                self._apply([("put", patient_id, record) for patient_id, record in records.items() if patient_id not in self._data])
+        return taken
+
+    def update_many(self, applies: dict) -> dict:
+        failed, mutations = {}, []
+        with self._record_locks_for(applies), self._write_section():
+            for patient_id, apply in applies.items():
+                current = self._data.get(patient_id)
+                if current is None:
+                    failed[patient_id] = KeyError(patient_id)
+                    continue
+                try:
+                    mutations.append(("put", patient_id, apply(dict(current))))
+                except Exception as e:
+                    failed[patient_id] = e
+            with self._lock:
+                self._apply(mutations)
+        return failed
+
+    def delete_many(self, patient_ids: list) -> list:
+        with self._record_locks_for(patient_ids), self._write_section():
+            missing = [patient_id for patient_id in patient_ids if patient_id not in self._data]
+            with self._lock:
+                self._apply([("del", patient_id, None) for patient_id in dict.fromkeys(patient_ids) if patient_id in self._data])
+        return missing
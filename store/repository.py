@@ -0,0 +1,24 @@
+"""Picks the patient storage backend from the PATIENT_BACKEND env variable"""
+
+import os
+from store.base import PatientRepository
+
+# "json": in-memory store persisted to patients.json, "sqlite": indexed patients.db,
+# "mmap": binary patients.snap mapped read-only and shared by every uvicorn worker
+PATIENT_BACKEND = os.getenv("PATIENT_BACKEND", "json")
+
+
+def create_repository(backend: str = PATIENT_BACKEND) -> PatientRepository:
+    if backend == "json":
+        from store.patient_store import PatientStore
+
+        return PatientStore()
+    if backend == "sqlite":
+        from store.sqlite_store import SqlitePatientRepository
+
+        return SqlitePatientRepository()
+    if backend == "mmap":
+        from store.mmap_store import MmapPatientRepository
+
+        return MmapPatientRepository()
+    raise ValueError(f"Unknown patient backend {backend!r}")
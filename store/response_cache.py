@@ -0,0 +1,179 @@
+"""LRU + TTL cache of serialized read responses, invalidated by patient mutations"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+from store.change_notify import ChangeCounter
+
+# 0 disables the cache
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# upper bound on the age of an entry, writes of other workers clear the cache through the change counter
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def etag_in(if_none_match: Optional[str], etag: str) -> bool:
+    """True if the If-None-Match header matches `etag`, weak comparison like RFC 9110"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip_weak = lambda tag: tag.strip().removeprefix("W/")
+    return strip_weak(etag) in {strip_weak(tag) for tag in if_none_match.split(",")}
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict
+    expires_at: float
+    # the one patient this response shows, None for responses over the whole store
+    patient_id: Optional[str] = None
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        self.size = len(self.body)
+
+
+class ResponseCache:
+    """Pre-serialized response bodies keyed by route and query parameters.
+
+    Entries of a single patient (`patient_id` set) are dropped when that
+    patient changes, entries over the whole store (/view, /sort) on every
+    change. `version` is bumped by each invalidation: a response computed
+    before a write finished carries the old version and is not stored.
+    Least recently used entries are evicted beyond `max_entries` or
+    `max_bytes`.
+
+    With `changes`, the repository's shared ChangeCounter, every lookup first
+    polls it and a write of another worker clears the whole cache, since
+    which patients it touched is not known here.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        changes: Optional[ChangeCounter] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = 0
+        self._entries: OrderedDict = OrderedDict()
+        # patient id -> keys of its entries, None -> keys of the whole-store entries
+        self._by_patient: dict = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "invalidations": 0, "remote_clears": 0}
+        self.changes = changes
+        if changes is not None:
+            changes.subscribe(self._remote_change)
+
+    @staticmethod
+    def key(path: str, query: Iterable[tuple]) -> tuple:
+        # same parameters in a different order share one entry
+        return (path, tuple(sorted(query)))
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        if self.changes is not None:
+            self.changes.poll()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+
+    def put(
+        self,
+        key: tuple,
+        body: bytes,
+        headers: dict,
+        version: int,
+        patient_id: Optional[str] = None,
+    ) -> CachedResponse:
+        """Cache `body` unless the store changed since `version` was read, returns the entry either way.
+
+        An "etag" in `headers` is kept as the ETag (e.g. the record ETag used
+        by If-Match), otherwise it is a hash of the body.
+        """
+        headers = {name.lower(): value for name, value in headers.items()}
+        etag = headers.pop("etag", None) or body_etag(body)
+        entry = CachedResponse(body, etag, headers, time.monotonic() + self.ttl, patient_id)
+        if self.max_entries <= 0 or entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            if version != self.version:
+                return entry
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._by_patient.setdefault(patient_id, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+        return entry
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._by_patient[entry.patient_id]
+        keys.discard(key)
+        if not keys:
+            del self._by_patient[entry.patient_id]
+
+    def invalidate(self, patient_ids: Iterable[str]):
+        """Forget every response showing one of `patient_ids` and every whole-store response"""
+        patient_ids = list(patient_ids)
+        if not patient_ids:
+            return
+        with self._lock:
+            self.version += 1
+            stale = set(self._by_patient.get(None, ()))
+            for patient_id in patient_ids:
+                stale.update(self._by_patient.get(patient_id, ()))
+            for key in stale:
+                self._drop(key)
+            self.counters["invalidations"] += len(stale)
+
+    def _remote_change(self):
+        self.clear()
+        self.count("remote_clears")
+
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._by_patient.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
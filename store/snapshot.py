@@ -0,0 +1,80 @@
+"""Crash-safe atomic snapshot writes with a cross-process generation counter"""
+
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Optional
+from store import codec
+from store.change_notify import ChangeCounter, notify_change
+
+
+def generation_path(path: str) -> str:
+    return f"{path}.gen"
+
+
+def read_generation(path: str) -> int:
+    """Generation of the snapshot at `path`, 0 if it was never written through `write_snapshot`"""
+    try:
+        with open(generation_path(path), "r") as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+@contextmanager
+def writer_lock(path: str):
+    # serialises writers of different uvicorn workers, readers never take it
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _fsync_dir(path: str):
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _atomic_write(path: str, write):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
+
+
+def publish(path: str, write, changes: Optional[ChangeCounter] = None) -> int:
+    """Atomically replace `path` with what `write(f)` writes and bump its generation.
+
+    The caller holds `writer_lock(path)`. The content goes to a temp file,
+    is fsynced and renamed over `path`, so a reader sees either the old or the
+    new document, never a truncated one. Other workers are told through the
+    shared change counter of `path`, `changes` if this process keeps one open.
+    Returns the new generation.
+    """
+    _atomic_write(path, write)
+    generation = read_generation(path) + 1
+    _atomic_write(generation_path(path), lambda f: f.write(str(generation).encode("ascii")))
+    if changes is None:
+        notify_change(path)
+    else:
+        changes.bump()
+    return generation
+
+
+def write_snapshot(data: dict, path: str, changes: Optional[ChangeCounter] = None) -> int:
+    """Atomically replace `path` with `data` encoded by store.codec, returns the new generation"""
+    with writer_lock(path):
+        return publish(path, lambda f: codec.dump(data, f), changes)
@@ -0,0 +1,69 @@
+"""Secondary indexes kept in sync with the in-memory patient store"""
+
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from operator import itemgetter
+from typing import Iterator, Optional
+from store.base import page_key
+
+
+class SortedIndex:
+    """Patient ids ordered by one numeric field, or by the id itself for field "id".
+
+    Backed by a bisect maintained list of `page_key` tuples, so an add or
+    remove is a binary search plus one memmove and reading the order in
+    either direction, from any keyset position, is a plain walk over the list.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._entries: list = []
+
+    def _key(self, patient_id: str, record: dict) -> tuple:
+        return page_key(patient_id, record, self.field)
+
+    def rebuild(self, data: dict):
+        self._entries = sorted(self._key(patient_id, record) for patient_id, record in data.items())
+
+    def add(self, patient_id: str, record: dict):
+        insort(self._entries, self._key(patient_id, record))
+
+    def remove(self, patient_id: str, record: dict):
+        key = self._key(patient_id, record)
+        position = bisect_left(self._entries, key)
+        if position < len(self._entries) and self._entries[position] == key:
+            del self._entries[position]
+
+    def ids(
+        self,
+        descending: bool = False,
+        after: Optional[tuple] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Iterator[str]:
+        """Ids in index order, starting strictly past the keyset position `after`"""
+        if descending:
+            end = len(self._entries) if after is None else bisect_left(self._entries, tuple(after))
+            positions = range(end - 1, -1, -1)
+        else:
+            start = 0 if after is None else bisect_right(self._entries, tuple(after))
+            positions = range(start, len(self._entries))
+        stop = None if limit is None else offset + limit
+        return (self._entries[position][1] for position in islice(positions, offset, stop))
+
+    def _span(self, low, high) -> tuple:
+        start = 0 if low is None else bisect_left(self._entries, low, key=itemgetter(0))
+        end = len(self._entries) if high is None else bisect_right(self._entries, high, key=itemgetter(0))
+        return start, max(start, end)
+
+    def count_between(self, low, high) -> int:
+        """Number of ids whose value is inside the inclusive range, two binary searches"""
+        start, end = self._span(low, high)
+        return end - start
+
+    def ids_between(self, low, high) -> Iterator[str]:
+        start, end = self._span(low, high)
+        return (patient_id for _, patient_id in islice(self._entries, start, end))
+
+    def __len__(self) -> int:
+        return len(self._entries)
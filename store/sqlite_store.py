@@ -0,0 +1,258 @@
+"""SQLite backed patient repository with indexed columns"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+from store.base import PatientRepository, PreconditionFailed, SORT_FIELDS, etag_matches
+from store.change_notify import ChangeCounter
+
+PATIENTS_DB = os.getenv("PATIENTS_DB", "patients.db")
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "name", "city", "age", "gender", "height", "weight", "bmi", "verdict")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id      TEXT PRIMARY KEY,
+    name    TEXT,
+    city    TEXT,
+    age     INTEGER,
+    gender  TEXT,
+    height  REAL,
+    weight  REAL,
+    bmi     REAL,
+    verdict TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_patients_city    ON patients(city);
+CREATE INDEX IF NOT EXISTS idx_patients_gender  ON patients(gender);
+CREATE INDEX IF NOT EXISTS idx_patients_age     ON patients(age);
+CREATE INDEX IF NOT EXISTS idx_patients_bmi     ON patients(bmi);
+CREATE INDEX IF NOT EXISTS idx_patients_verdict ON patients(verdict);
+CREATE INDEX IF NOT EXISTS idx_patients_height  ON patients(height);
+CREATE INDEX IF NOT EXISTS idx_patients_weight  ON patients(weight);
+"""
+
+SELECT_SQL = f"SELECT {', '.join(COLUMNS)} FROM patients"
+INSERT_SQL = f"INSERT INTO patients ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+UPSERT_SQL = INSERT_SQL.replace("INSERT", "INSERT OR REPLACE", 1)
+
+# json record key -> column
+SORT_COLUMNS = {field: "bmi" if key == "compute_bmi" else key for field, key in SORT_FIELDS.items()}
+
+
+def record_to_row(patient_id: str, record: dict) -> tuple:
+    return (
+        patient_id,
+        record.get("name"),
+        record.get("city"),
+        record.get("age"),
+        record.get("gender"),
+        record.get("height"),
+        record.get("weight"),
+        record.get("compute_bmi", record.get("bmi")),
+        record.get("decide_verdict", record.get("verdict")),
+    )
+
+
+def row_to_record(row: tuple) -> dict:
+    patient_id, name, city, age, gender, height, weight, bmi, verdict = row
+    return {
+        "id": patient_id,
+        "name": name,
+        "city": city,
+        "age": age,
+        "gender": gender,
+        "height": height,
+        "weight": weight,
+        "compute_bmi": bmi,
+        "decide_verdict": verdict,
+    }
+
+
+class SqlitePatientRepository(PatientRepository):
+    """Patients in one indexed SQLite table.
+
+    The database runs in WAL journal mode so readers never block the writer.
+    Every thread of the uvicorn threadpool gets its own connection; mutations
+    run in `BEGIN IMMEDIATE` transactions, which serialises read-modify-write
+    across threads and processes without any lock of our own.
+
+    Every committed write bumps the shared memory ChangeCounter of the
+    database, so response caches of other workers drop what they hold.
+    """
+
+    def __init__(self, path: str = PATIENTS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.changes = ChangeCounter(path)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit, transactions are opened explicitly where needed. Only the
+            # owning thread uses it, check_same_thread=False just lets stop() close it
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def start(self):
+        self.changes.open()
+        self._connection().executescript(SCHEMA)
+        logger.info(f"Opened {self.path} with {len(self)} patients")
+
+    def stop(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+        self.changes.close()
+
+    # ---------------- reads ----------------
+
+    def all(self) -> dict:
+        rows = self._connection().execute(SELECT_SQL)
+        return {row[0]: row_to_record(row) for row in rows}
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        row = self._connection().execute(f"{SELECT_SQL} WHERE id = ?", (patient_id,)).fetchone()
+        return row_to_record(row) if row else None
+
+    def page(
+        self,
+        field: str,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[tuple] = None,
+    ) -> list:
+        column = "id" if field == "id" else SORT_COLUMNS[field]
+        direction = "DESC" if descending else "ASC"
+        sql, params = SELECT_SQL, []
+        if after is not None:
+            # keyset: row value comparison walks the index from the cursor on
+            sql += f" WHERE ({column}, id) {'<' if descending else '>'} (?, ?)"
+            params += list(after)
+        sql += f" ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        rows = self._connection().execute(sql, params)
+        return [(row[0], row_to_record(row)) for row in rows]
+
+    def search(self, equals: dict, ranges: dict, limit: Optional[int] = None, offset: int = 0) -> list:
+        # every filter column is indexed, SQLite's planner picks the most selective one
+        conditions, params = [], []
+        for field, value in equals.items():
+            conditions.append(f"{field} = ?")
+            params.append(value)
+        for field, (low, high) in ranges.items():
+            if low is not None:
+                conditions.append(f"{field} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{field} <= ?")
+                params.append(high)
+        sql = SELECT_SQL
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        rows = self._connection().execute(sql, params)
+        return [(row[0], row_to_record(row)) for row in rows]
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    # ---------------- writes ----------------
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.changes.bump()
+
+    def put_many(self, records: Iterable[tuple]):
+        """Write many (patient_id, record) pairs in a single transaction"""
+        with self._transaction() as conn:
+            conn.executemany(UPSERT_SQL, (record_to_row(patient_id, record) for patient_id, record in records))
+
+    def insert_many(self, records: dict) -> list:
+        with self._transaction() as conn:
+            taken = [patient_id for patient_id in records if self.get(patient_id) is not None]
+            skip = set(taken)
+            conn.executemany(
+                INSERT_SQL,
+                (record_to_row(patient_id, record) for patient_id, record in records.items() if patient_id not in skip),
+            )
+        return taken
+
+    def update_many(self, applies: dict) -> dict:
+        failed, rows = {}, []
+        with self._transaction() as conn:
+            for patient_id, apply in applies.items():
+                current = self.get(patient_id)
+                if current is None:
+                    failed[patient_id] = KeyError(patient_id)
+                    continue
+                try:
+                    rows.append(record_to_row(patient_id, apply(dict(current))))
+                except Exception as e:
+                    failed[patient_id] = e
+            conn.executemany(UPSERT_SQL, rows)
+        return failed
+
+    def delete_many(self, patient_ids: list) -> list:
+        with self._transaction() as conn:
+            missing = [patient_id for patient_id in patient_ids if self.get(patient_id) is None]
+            # deleting an id that does not exist is a no-op
+            conn.executemany("DELETE FROM patients WHERE id = ?", ((patient_id,) for patient_id in dict.fromkeys(patient_ids)))
+        return missing
+
+    def insert(self, patient_id: str, record: dict) -> bool:
+        try:
+            self._connection().execute(INSERT_SQL, record_to_row(patient_id, record))
+        except sqlite3.IntegrityError:
+            return False
+        self.changes.bump()
+        return True
+
+    def update(
+        self,
+        patient_id: str,
+        apply: Callable[[dict], dict],
+        if_match: Optional[str] = None,
+    ) -> dict:
+        with self._transaction() as conn:
+            current = self.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            record = apply(dict(current))
+            conn.execute(UPSERT_SQL, record_to_row(patient_id, record))
+        # the stored shape, so the caller's ETag matches the one GET returns
+        return row_to_record(record_to_row(patient_id, record))
+
+    def delete(self, patient_id: str, if_match: Optional[str] = None):
+        with self._transaction() as conn:
+            current = self.get(patient_id)
+            if current is None:
+                raise KeyError(patient_id)
+            if not etag_matches(if_match, current):
+                raise PreconditionFailed(patient_id)
+            conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
@@ -0,0 +1,92 @@
+"""Append-only write-ahead log for patient mutations"""
+
+import logging
+import os
+import shutil
+from store import codec
+
+logger = logging.getLogger(__name__)
+
+
+class WriteAheadLog:
+    """One compact json line per mutation.
+
+    `{"op": "put", "id": "P001", "data": {...}}` or `{"op": "del", "id": "P001"}`.
+    Entries are idempotent, so replaying a log that is already folded into
+    the snapshot is harmless.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.entries = 0
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append_many(self, mutations: list):
+        """Append `(op, patient_id, record)` entries with a single flush/fsync"""
+        lines = []
+        for op, patient_id, record in mutations:
+            entry = {"op": op, "id": patient_id}
+            if record is not None:
+                entry["data"] = record
+            lines.append(codec.dumps(entry) + b"\n")
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.entries += len(lines)
+
+    @property
+    def rotated_path(self) -> str:
+        return f"{self.path}.old"
+
+    def rotate(self) -> str:
+        """Move the current log aside and start an empty one, returns the old path.
+
+        A rotated log still lying around belongs to a compaction whose
+        snapshot write failed, its entries are in no snapshot yet: the current
+        log is appended to it, so it keeps every entry in order.
+        """
+        self.close()
+        rotated = self.rotated_path
+        if os.path.exists(self.path):
+            if os.path.exists(rotated):
+                with open(rotated, "ab") as old_log, open(self.path, "rb") as log:
+                    shutil.copyfileobj(log, old_log)
+                    old_log.flush()
+                    os.fsync(old_log.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, rotated)
+        self.entries = 0
+        self.open()
+        return rotated
+
+    @staticmethod
+    def replay(path: str, data: dict) -> int:
+        """Apply every entry of the log at `path` to `data`, returns number of entries applied"""
+        if not os.path.exists(path):
+            return 0
+        applied = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = codec.loads(line)
+                except codec.DecodeError:
+                    # torn last line of a crashed append, everything before it is valid
+                    logger.warning(f"Ignoring partial entry at the end of {path}")
+                    break
+                if entry["op"] == "put":
+                    data[entry["id"]] = entry["data"]
+                elif entry["op"] == "del":
+                    data.pop(entry["id"], None)
+                applied += 1
+        return applied
@@ -0,0 +1,51 @@
+"""A failed compaction must not lose write-ahead log entries, even when compact() runs again"""
+
+import pytest
+
+from store import patient_store
+from store.patient_store import PatientStore, load_all
+
+
+def patient(weight: float) -> dict:
+    return {"name": "a", "city": "Pune", "age": 30, "gender": "male", "height": 1.7, "weight": weight}
+
+
+def wal_store(path) -> PatientStore:
+    # no background compaction thread, the test decides when compact() runs
+    store = PatientStore(str(path), mode="wal", compact_interval=0)
+    store.start()
+    return store
+
+
+def failing_save_all(data, path, changes=None):
+    raise OSError("No space left on device")
+
+
+@pytest.mark.parametrize("second_compaction_fails", [True, False])
+def test_failed_compactions_keep_every_write(tmp_path, monkeypatch, second_compaction_fails):
+    path = tmp_path / "patients.json"
+    store = wal_store(path)
+    store.insert("P1", patient(60))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(patient_store, "save_all", failing_save_all)
+        with pytest.raises(OSError):
+            store.compact()
+        # P1 is only in the log the failed compaction rotated away
+        store.insert("P2", patient(70))
+        store.update("P2", lambda record: {**record, "weight": 75})
+        if second_compaction_fails:
+            with pytest.raises(OSError):
+                store.compact()
+    if not second_compaction_fails:
+        store.compact()
+        assert load_all(str(path)).keys() == {"P1", "P2"}
+    store.insert("P3", patient(80))
+
+    # crash: no stop(), the next process replays whatever the logs hold
+    restarted = wal_store(path)
+    try:
+        assert restarted.all().keys() == {"P1", "P2", "P3"}
+        assert restarted.get("P2")["weight"] == 75
+    finally:
+        restarted.stop()